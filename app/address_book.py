@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import difflib
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select, desc
+
+from .cache import TTLCache
+from .db import SessionLocal, Order
+from .fast_parse import PLATE_RE
+from .geo import geocode_many
+from .geo_cache import normalize_address
+
+
+# How many recent orders of a user feed the address book
+_HISTORY_LIMIT = 500
+_MIN_PREFIX = 3
+_FUZZY_CUTOFF = 0.85
+
+_SEPARATORS_RE = re.compile(r"\s*(?:;|→|->)\s*")
+_NUMBER_RE = re.compile(r"^\d+[0-9а-яa-z/-]*$")
+
+_books = TTLCache(maxsize=1024, ttl=600.0)
+
+
+@dataclass
+class BookEntry:
+    address: str
+    coord: Optional[Tuple[float, float]]
+    geocoder: Optional[str]
+    count: int
+
+
+@dataclass
+class AddressBook:
+    entries: Dict[str, BookEntry] = field(default_factory=dict)  # normalized address -> entry
+    keys: List[str] = field(default_factory=list)  # sorted normalized addresses, for prefix search
+    routes: List[Tuple[str, str]] = field(default_factory=list)  # most frequent first
+    car_number: Optional[str] = None  # most recent
+
+    def match(self, ref: str) -> Optional[BookEntry]:
+        key = normalize_address(ref)
+        if not key:
+            return None
+        entry = self.entries.get(key)
+        if entry:
+            return entry
+        numbers = _numbers(key)
+        if len(key) >= _MIN_PREFIX:
+            # Prefix of a known address
+            i = bisect.bisect_left(self.keys, key)
+            candidates = []
+            while i < len(self.keys) and self.keys[i].startswith(key):
+                if numbers <= _numbers(self.keys[i]):
+                    candidates.append(self.entries[self.keys[i]])
+                i += 1
+            if not candidates:
+                # Every word of the reference starts a word of the address ("объект 3", "карьер")
+                words = key.split()
+                for k in self.keys:
+                    k_words = k.split()
+                    if all(any(kw.startswith(w) for kw in k_words) for w in words) and numbers <= _numbers(k):
+                        candidates.append(self.entries[k])
+            best = _most_frequent(candidates)
+            if best:
+                return best
+        close = difflib.get_close_matches(key, self.keys, n=1, cutoff=_FUZZY_CUTOFF)
+        if close and numbers <= _numbers(close[0]):
+            return self.entries[close[0]]
+        # "Арбат 1" is not "Арбат 10": a new house is geocoded as usual
+        return None
+
+    def resolve_step1(self, text: str) -> Optional[Dict[str, Any]]:
+        # "[номер;] адрес; [адрес;] адрес" where every address is a known one
+        parts = [p for p in _SEPARATORS_RE.split(text.strip()) if p]
+        car_number = None
+        if parts and PLATE_RE.fullmatch(parts[0]):
+            car_number = parts.pop(0).replace(" ", "").upper()
+        if len(parts) < 2:
+            return None
+        matched = [self.match(p) for p in parts]
+        if not all(matched):
+            return None
+        stops = [m.address for m in matched]  # type: ignore
+        return {
+            "car_number": car_number or self.car_number,
+            "address_from": stops[0],
+            "address_to": stops[-1],
+            "stops": stops,
+        }
+
+
+def _numbers(key: str) -> Set[str]:
+    # House (and object) numbers of a normalized address
+    return {t for t in key.split() if _NUMBER_RE.match(t)}
+
+
+def _most_frequent(candidates: List[BookEntry]) -> Optional[BookEntry]:
+    # Only accept an unambiguous winner
+    if not candidates:
+        return None
+    ranked = sorted(candidates, key=lambda e: e.count, reverse=True)
+    if len(ranked) == 1 or ranked[0].count > ranked[1].count:
+        return ranked[0]
+    return None
+
+
+def _load_book(user_id: int) -> AddressBook:
+    book = AddressBook()
+    route_counts: Counter = Counter()
+    with SessionLocal() as db:
+        stmt = (
+            select(
+                Order.car_number,
+                Order.address_from, Order.from_lat, Order.from_lon, Order.from_geocoder,
+                Order.address_to, Order.to_lat, Order.to_lon, Order.to_geocoder,
+            )
+            .where(Order.user_id == user_id)
+            .order_by(desc(Order.id))
+            .limit(_HISTORY_LIMIT)
+        )
+        for car, a_from, from_lat, from_lon, from_geo, a_to, to_lat, to_lon, to_geo in db.execute(stmt):
+            if car and not book.car_number:
+                book.car_number = car
+            for address, lat, lon, geocoder in ((a_from, from_lat, from_lon, from_geo), (a_to, to_lat, to_lon, to_geo)):
+                key = normalize_address(address or "")
+                if not key:
+                    continue
+                entry = book.entries.get(key)
+                if entry is None:
+                    coord = (lat, lon) if lat is not None and lon is not None else None
+                    entry = book.entries[key] = BookEntry(address, coord, geocoder, 0)
+                entry.count += 1
+            if a_from and a_to:
+                route_counts[(a_from, a_to)] += 1
+    book.keys = sorted(book.entries)
+    book.routes = [route for route, _ in route_counts.most_common()]
+    return book
+
+
+async def get_book(user_id: int) -> AddressBook:
+    book = _books.get(user_id)
+    if book is None:
+        book = await asyncio.to_thread(_load_book, user_id)
+        _books.set(user_id, book)
+    return book
+
+
+def invalidate(user_id: int) -> None:
+    _books.pop(user_id)
+
+
+async def geocode_stops(
+    book: AddressBook, stops: List[str]
+) -> List[Optional[Tuple[Tuple[float, float], Optional[str]]]]:
+    # Coordinates stored with the user's past orders are reused; only new addresses are geocoded
+    found: List[Optional[Tuple[Tuple[float, float], Optional[str]]]] = []
+    missing = []
+    for i, stop in enumerate(stops):
+        entry = book.entries.get(normalize_address(stop))
+        if entry and entry.coord:
+            found.append((entry.coord, entry.geocoder))
+        else:
+            found.append(None)
+            missing.append(i)
+    if missing:
+        for i, result in zip(missing, await geocode_many([stops[i] for i in missing])):
+            found[i] = result
+    return found
+
+
+def route_label(route: Tuple[str, str]) -> str:
+    return f"{route[0]} → {route[1]}"
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+
+from .config import load_config
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+# Local preprocessing before speech-to-text: decode with ffmpeg to 16 kHz mono PCM,
+# cut leading/trailing silence with an energy VAD, split long clips at quiet points
+# and re-encode every chunk as low-bitrate Opus.
+
+SAMPLE_RATE = 16000
+_FRAME = SAMPLE_RATE * 30 // 1000  # 30 ms
+_SILENCE_DB = -45.0  # absolute floor, dBFS
+_NOISE_MARGIN_DB = 12.0  # speech is this much louder than the quietest frames
+_PAD_FRAMES = 7  # ~200 ms kept around speech
+_SPLIT_WINDOW_S = 5.0  # look this far back from a chunk boundary for a pause
+_OPUS_BITRATE = "16k"
+
+
+async def _ffmpeg(args: List[str], data: bytes) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate(data)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {err.decode('utf-8', 'replace').strip()}")
+    return out
+
+
+async def decode(data: bytes) -> np.ndarray:
+    # Any input ffmpeg understands -> int16 mono at SAMPLE_RATE
+    out = await _ffmpeg(["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"], data)
+    return np.frombuffer(out, dtype=np.int16)
+
+
+async def encode(pcm: np.ndarray) -> bytes:
+    return await _ffmpeg(
+        ["-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "pipe:0",
+         "-c:a", "libopus", "-b:a", _OPUS_BITRATE, "-application", "voip", "-f", "ogg", "pipe:1"],
+        pcm.astype(np.int16).tobytes(),
+    )
+
+
+def frame_db(pcm: np.ndarray) -> np.ndarray:
+    # RMS level of every 30 ms frame, dBFS
+    n = len(pcm) // _FRAME
+    if n == 0:
+        return np.zeros(0)
+    frames = pcm[:n * _FRAME].astype(np.float64).reshape(n, _FRAME) / 32768.0
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-6))
+
+
+def speech_bounds(db: np.ndarray) -> Optional[Tuple[int, int]]:
+    # First and last voiced frame (end exclusive), padded; None if the clip is silent
+    if not len(db):
+        return None
+    # Noise floor from the quietest frames, but never above the loud ones: a clip that
+    # is speech from start to end has no quiet frames to learn the floor from
+    quiet, loud = np.percentile(db, [10, 90])
+    threshold = max(_SILENCE_DB, min(float(quiet), float(loud) - 2 * _NOISE_MARGIN_DB) + _NOISE_MARGIN_DB)
+    voiced = np.flatnonzero(db > threshold)
+    if not len(voiced):
+        return None
+    return max(0, int(voiced[0]) - _PAD_FRAMES), min(len(db), int(voiced[-1]) + 1 + _PAD_FRAMES)
+
+
+def split_points(db: np.ndarray, max_frames: int) -> List[int]:
+    # Frame indexes to cut at: the quietest frame shortly before every max_frames boundary
+    window = int(_SPLIT_WINDOW_S * 1000 / 30)
+    cuts: List[int] = []
+    start = 0
+    while len(db) - start > max_frames:
+        hi = start + max_frames
+        lo = max(start + 1, hi - window)
+        cut = lo + int(np.argmin(db[lo:hi]))
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+async def preprocess(audio: BinaryIO) -> Optional[List[bytes]]:
+    # Opus chunks ready for upload; [] for a silent clip, None when ffmpeg is unavailable or fails
+    try:
+        pcm = await decode(audio.read())
+    except (OSError, RuntimeError) as e:
+        logger.warning("audio decode failed, sending the original file: %s", e)
+        return None
+    db = frame_db(pcm)
+    bounds = speech_bounds(db)
+    if bounds is None:
+        return []
+    db = db[bounds[0]:bounds[1]]
+    pcm = pcm[bounds[0] * _FRAME:bounds[1] * _FRAME]
+    max_frames = max(1, int(_config.stt_chunk_seconds * 1000 / 30))
+    edges = [0, *split_points(db, max_frames), len(db)]
+    try:
+        return list(await asyncio.gather(*[
+            encode(pcm[a * _FRAME:b * _FRAME]) for a, b in zip(edges, edges[1:])
+        ]))
+    except (OSError, RuntimeError) as e:
+        logger.warning("audio encode failed, sending the original file: %s", e)
+        return None
+
+
+async def _bench(paths: List[str], transcribe: bool) -> None:
+    from io import BytesIO
+
+    from .openai_client import close_openai_client
+    from .openai_stt import whisper_stt_ogg_opus
+
+    total_in = total_out = 0
+    try:
+        for path in paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            started = time.monotonic()
+            chunks = await preprocess(BytesIO(data))
+            prep = time.monotonic() - started
+            if chunks is None:
+                print(f"{path}: preprocessing failed")
+                continue
+            out = sum(len(c) for c in chunks)
+            total_in += len(data)
+            total_out += out
+            line = f"{path}: {len(data)} -> {out} bytes ({len(chunks)} chunks), preprocess {prep:.2f}s"
+            if transcribe:
+                started = time.monotonic()
+                await whisper_stt_ogg_opus(data)
+                raw = time.monotonic() - started
+                started = time.monotonic()
+                await asyncio.gather(*[whisper_stt_ogg_opus(c) for c in chunks])
+                done = time.monotonic() - started
+                line += f", whisper raw {raw:.2f}s vs preprocessed {prep + done:.2f}s"
+            print(line)
+    finally:
+        await close_openai_client()
+    if total_in:
+        print(f"Итого: {total_in} -> {total_out} байт ({100.0 * (1 - total_out / total_in):.0f}% меньше)")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser(prog="python -m app.audio", description="Предобработка голосовых перед распознаванием")
+    sub = p.add_subparsers(dest="command", required=True)
+    p_bench = sub.add_parser("bench", help="сравнить размер (и время Whisper) до и после предобработки")
+    p_bench.add_argument("paths", nargs="+")
+    p_bench.add_argument("--transcribe", action="store_true", help="также замерить время распознавания Whisper")
+    args = p.parse_args()
+    asyncio.run(_bench(args.paths, args.transcribe))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,16 @@
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+
+# provider -> (requests per second, burst)
+_DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "nominatim": (1.0, 1.0),
+    "osrm": (1.0, 2.0),
+    "yandex_geocoder": (20.0, 20.0),
+    "yandex_routing": (10.0, 10.0),
+    "openai": (5.0, 10.0),
+}
 
 
 @dataclass
@@ -11,6 +22,92 @@ class Config:
     yandex_maps_api_key: str | None
     # DB
     database_url: str
+    # Connection pool (pool size and overflow apply to PostgreSQL only)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: float = 1800.0  # seconds; -1 disables
+    # SQLite tuning, applied to every new connection
+    sqlite_wal: bool = True  # journal_mode=WAL + synchronous=NORMAL
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # bytes
+    sqlite_cache_kb: int = 64 * 1024
+    sqlite_busy_timeout: float = 5.0  # seconds a writer waits for the lock
+    # Handler writes on SQLite go through one writer task that commits them in batches
+    db_single_writer: bool = True
+    db_write_batch: int = 64
+    # Half-filled orders left by the old two-insert flow: "archive" (orders_archive), "delete" or "off"
+    order_sweep: str = "archive"
+    order_sweep_age: float = 86400.0  # seconds since created_at
+    order_sweep_interval: float = 3600.0
+    # Update delivery: "polling" (default) or "webhook" with an embedded aiohttp server
+    bot_mode: str = "polling"
+    webhook_url: str | None = None  # public URL Telegram posts to, e.g. https://bot.example.com/webhook
+    webhook_path: str = "/webhook"
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_secret: str | None = None
+    webhook_drain_timeout: float = 30.0
+    # FSM storage: "sql" (table fsm_states, survives restarts, shared by replicas) or "memory"
+    fsm_storage: str = "sql"
+    fsm_ttl: float = 86400.0  # abandoned drafts expire after this long
+    fsm_cache_size: int = 1024
+    fsm_cache_ttl: float = 2.0  # keep short when several replicas serve the same users
+    # Geo HTTP client
+    geo_http_timeout: float = 20.0
+    geo_http_max_connections: int = 20
+    # Geocode cache
+    geocode_cache_size: int = 2048
+    geocode_cache_ttl: float = 6 * 3600.0
+    geocode_cache_db_ttl: float = 30 * 86400.0
+    # Route cache
+    route_cache_precision: int = 4
+    route_cache_symmetric: bool = False
+    route_cache_ttl: float = 30 * 86400.0
+    route_cache_size: int = 2048  # in-memory entries
+    # Provider hedging / circuit breaker
+    geo_hedge: bool = False
+    geo_hedge_delay: float = 1.5
+    breaker_failures: int = 3
+    breaker_cooldown: float = 60.0
+    # Rate limits for external APIs
+    rate_limits: Dict[str, Tuple[float, float]] = field(default_factory=lambda: dict(_DEFAULT_RATE_LIMITS))
+    rate_limit_shared: bool = False
+    # Known locations distance matrix
+    matrix_block_size: int = 10
+    matrix_refresh_interval: float = 86400.0
+    stats_log_interval: float = 600.0  # seconds between "stats" log lines; 0 disables
+    # OpenAI client
+    openai_timeout: float = 30.0
+    openai_stt_timeout: float = 60.0
+    openai_max_retries: int = 2
+    openai_max_connections: int = 20
+    # Voice messages: size cap, in-memory part of the download buffer, transcription cache
+    stt_max_bytes: int = 20 * 1024 * 1024
+    stt_spool_bytes: int = 1024 * 1024
+    stt_cache_size: int = 1024
+    stt_cache_ttl: float = 7 * 86400.0
+    # Transcription workers: pool size, in-flight notes per user, backends ("openai", "google")
+    stt_workers: int = 4
+    stt_per_user: int = 2
+    stt_backends: Tuple[str, ...] = ("openai",)
+    # Local audio preprocessing before stt (needs ffmpeg): trim silence, 16 kHz mono, split long clips
+    stt_preprocess: bool = False
+    stt_chunk_seconds: float = 60.0
+    # Google Cloud Speech credentials (service account JSON), for the "google" stt backend
+    gcp_service_account_json: str | None = None
+    # LLM backends ("openai", "google"), tried fastest first; optional hedging after the p95 latency
+    llm_providers: Tuple[str, ...] = ("openai", "google")
+    llm_hedge: bool = False
+    llm_hedge_min_delay: float = 0.5
+    google_genai_api_key: str | None = None
+    # LLM extraction cache
+    llm_cache_size: int = 1024
+    llm_cache_ttl: float = 7 * 86400.0
+    # Rule-based parser confidence needed to skip the LLM (above 1 disables the fast path)
+    fast_path_threshold: float = 0.8
+    # Offline gazetteer: index file and its place in the provider chain ("first" / "last")
+    gazetteer_path: str | None = None
+    gazetteer_mode: str = "last"
 
 
 def _resolve_database_url() -> str:
@@ -30,10 +127,127 @@ def _resolve_database_url() -> str:
     return "sqlite:///data.db"
 
 
+def _env_float(name: str, default: float) -> float:
+    raw = os.environ.get(name)
+    if not raw:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.environ.get(name)
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.environ.get(name)
+    if not raw:
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_list(name: str, default: Tuple[str, ...]) -> Tuple[str, ...]:
+    raw = os.environ.get(name)
+    if not raw:
+        return default
+    return tuple(item.strip() for item in raw.split(",") if item.strip())
+
+
+def _env_rate_limits(name: str) -> Dict[str, Tuple[float, float]]:
+    # Format: "nominatim=1:1,openai=5:10" (rate per second : burst)
+    limits = dict(_DEFAULT_RATE_LIMITS)
+    raw = os.environ.get(name) or ""
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        rate_s, _, burst_s = value.partition(":")
+        try:
+            rate = float(rate_s)
+            burst = float(burst_s) if burst_s else max(1.0, rate)
+        except ValueError:
+            continue
+        limits[key.strip()] = (rate, burst)
+    return limits
+
+
 def load_config() -> Config:
     return Config(
         telegram_bot_token=os.environ.get("TELEGRAM_BOT_TOKEN", ""),
         openai_api_key=os.environ.get("OPENAI_API_KEY"),
         yandex_maps_api_key=os.environ.get("YANDEX_MAPS_API_KEY"),
         database_url=_resolve_database_url(),
+        db_pool_size=_env_int("DB_POOL_SIZE", 5),
+        db_max_overflow=_env_int("DB_MAX_OVERFLOW", 10),
+        db_pool_pre_ping=_env_bool("DB_POOL_PRE_PING", True),
+        db_pool_recycle=_env_float("DB_POOL_RECYCLE", 1800.0),
+        sqlite_wal=_env_bool("SQLITE_WAL", True),
+        sqlite_mmap_size=_env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        sqlite_cache_kb=_env_int("SQLITE_CACHE_KB", 64 * 1024),
+        sqlite_busy_timeout=_env_float("SQLITE_BUSY_TIMEOUT", 5.0),
+        db_single_writer=_env_bool("DB_SINGLE_WRITER", True),
+        db_write_batch=_env_int("DB_WRITE_BATCH", 64),
+        order_sweep=(os.environ.get("ORDER_SWEEP") or "archive").strip().lower(),
+        order_sweep_age=_env_float("ORDER_SWEEP_AGE", 86400.0),
+        order_sweep_interval=_env_float("ORDER_SWEEP_INTERVAL", 3600.0),
+        bot_mode=(os.environ.get("BOT_MODE") or "polling").strip().lower(),
+        webhook_url=os.environ.get("WEBHOOK_URL") or None,
+        webhook_path=os.environ.get("WEBHOOK_PATH") or "/webhook",
+        webhook_host=os.environ.get("WEBHOOK_HOST") or "0.0.0.0",
+        webhook_port=_env_int("WEBHOOK_PORT", _env_int("PORT", 8080)),
+        webhook_secret=os.environ.get("WEBHOOK_SECRET") or None,
+        webhook_drain_timeout=_env_float("WEBHOOK_DRAIN_TIMEOUT", 30.0),
+        fsm_storage=(os.environ.get("FSM_STORAGE") or "sql").strip().lower(),
+        fsm_ttl=_env_float("FSM_TTL", 86400.0),
+        fsm_cache_size=_env_int("FSM_CACHE_SIZE", 1024),
+        fsm_cache_ttl=_env_float("FSM_CACHE_TTL", 2.0),
+        geo_http_timeout=_env_float("GEO_HTTP_TIMEOUT", 20.0),
+        geo_http_max_connections=_env_int("GEO_HTTP_MAX_CONNECTIONS", 20),
+        geocode_cache_size=_env_int("GEOCODE_CACHE_SIZE", 2048),
+        geocode_cache_ttl=_env_float("GEOCODE_CACHE_TTL", 6 * 3600.0),
+        geocode_cache_db_ttl=_env_float("GEOCODE_CACHE_DB_TTL", 30 * 86400.0),
+        route_cache_precision=_env_int("ROUTE_CACHE_PRECISION", 4),
+        route_cache_symmetric=_env_bool("ROUTE_CACHE_SYMMETRIC", False),
+        route_cache_ttl=_env_float("ROUTE_CACHE_TTL", 30 * 86400.0),
+        route_cache_size=_env_int("ROUTE_CACHE_SIZE", 2048),
+        geo_hedge=_env_bool("GEO_HEDGE", False),
+        geo_hedge_delay=_env_float("GEO_HEDGE_DELAY", 1.5),
+        breaker_failures=_env_int("BREAKER_FAILURES", 3),
+        breaker_cooldown=_env_float("BREAKER_COOLDOWN", 60.0),
+        rate_limits=_env_rate_limits("RATE_LIMITS"),
+        rate_limit_shared=_env_bool("RATE_LIMIT_SHARED", False),
+        matrix_block_size=_env_int("MATRIX_BLOCK_SIZE", 10),
+        matrix_refresh_interval=_env_float("MATRIX_REFRESH_INTERVAL", 86400.0),
+        stats_log_interval=_env_float("STATS_LOG_INTERVAL", 600.0),
+        openai_timeout=_env_float("OPENAI_TIMEOUT", 30.0),
+        openai_stt_timeout=_env_float("OPENAI_STT_TIMEOUT", 60.0),
+        openai_max_retries=_env_int("OPENAI_MAX_RETRIES", 2),
+        openai_max_connections=_env_int("OPENAI_MAX_CONNECTIONS", 20),
+        stt_max_bytes=_env_int("STT_MAX_BYTES", 20 * 1024 * 1024),
+        stt_spool_bytes=_env_int("STT_SPOOL_BYTES", 1024 * 1024),
+        stt_cache_size=_env_int("STT_CACHE_SIZE", 1024),
+        stt_cache_ttl=_env_float("STT_CACHE_TTL", 7 * 86400.0),
+        stt_workers=_env_int("STT_WORKERS", 4),
+        stt_per_user=_env_int("STT_PER_USER", 2),
+        stt_backends=_env_list("STT_BACKENDS", ("openai",)),
+        stt_preprocess=_env_bool("STT_PREPROCESS", False),
+        stt_chunk_seconds=_env_float("STT_CHUNK_SECONDS", 60.0),
+        gcp_service_account_json=os.environ.get("GCP_SERVICE_ACCOUNT_JSON") or None,
+        llm_providers=_env_list("LLM_PROVIDERS", ("openai", "google")),
+        llm_hedge=_env_bool("LLM_HEDGE", False),
+        llm_hedge_min_delay=_env_float("LLM_HEDGE_MIN_DELAY", 0.5),
+        google_genai_api_key=os.environ.get("GOOGLE_GENAI_API_KEY") or None,
+        llm_cache_size=_env_int("LLM_CACHE_SIZE", 1024),
+        llm_cache_ttl=_env_float("LLM_CACHE_TTL", 7 * 86400.0),
+        fast_path_threshold=_env_float("FAST_PATH_THRESHOLD", 0.8),
+        gazetteer_path=os.environ.get("GAZETTEER_PATH") or None,
+        gazetteer_mode=(os.environ.get("GAZETTEER_MODE") or "last").strip().lower(),
     )
\ No newline at end of file
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, event, func, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
-from sqlalchemy import String, Float, Integer, DateTime, Text
+from sqlalchemy import String, Float, Integer, BigInteger, DateTime, Text, ForeignKey
 
 from .config import load_config
 
@@ -26,16 +28,204 @@ class Order(Base):
     address_to: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     distance_km: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
+    from_lat: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    from_lon: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    from_geocoder: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    to_lat: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    to_lon: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    to_geocoder: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    geocoded_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
     cargo_type: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
     load_amount: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     unload_amount: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     remainder: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
 
+class ArchivedOrder(Base):
+    # Orders that never got past step 1, moved out of "orders" by the sweeper
+    __tablename__ = "orders_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)  # original orders.id
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    user_id: Mapped[int] = mapped_column(Integer, index=True)
+    car_number: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    address_from: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    address_to: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    distance_km: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now())
+
+
+class OrderLeg(Base):
+    __tablename__ = "order_legs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), index=True)
+    seq: Mapped[int] = mapped_column(Integer)  # 0-based position of the leg in the trip
+    address_from: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    address_to: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    distance_km: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+
+class GeocodeCacheEntry(Base):
+    __tablename__ = "geocode_cache"
+
+    key: Mapped[str] = mapped_column(String(512), primary_key=True)  # normalized address
+    address: Mapped[str] = mapped_column(Text)
+    lat: Mapped[float] = mapped_column(Float)
+    lon: Mapped[float] = mapped_column(Float)
+    provider: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now())
+
+
+class RouteCacheEntry(Base):
+    __tablename__ = "route_cache"
+
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)  # quantized "lat,lon|lat,lon"
+    distance_km: Mapped[float] = mapped_column(Float)
+    provider: Mapped[str] = mapped_column(String(32))  # yandex / osrm / haversine
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now())
+
+
+class KnownLocation(Base):
+    __tablename__ = "known_locations"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(256))
+    kind: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)  # quarry / site
+    aliases: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # "|"-separated
+    lat: Mapped[float] = mapped_column(Float)
+    lon: Mapped[float] = mapped_column(Float)
+
+
+class DistanceMatrixEntry(Base):
+    __tablename__ = "distance_matrix"
+
+    origin_id: Mapped[int] = mapped_column(Integer, ForeignKey("known_locations.id", ondelete="CASCADE"), primary_key=True)
+    destination_id: Mapped[int] = mapped_column(Integer, ForeignKey("known_locations.id", ondelete="CASCADE"), primary_key=True)
+    distance_km: Mapped[float] = mapped_column(Float)
+    provider: Mapped[str] = mapped_column(String(32))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now())
+
+
+class RateLimitState(Base):
+    __tablename__ = "rate_limits"
+
+    provider: Mapped[str] = mapped_column(String(64), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float)
+    updated_at: Mapped[float] = mapped_column(Float)  # unix time
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)  # sha256 of prompt version, model, text
+    model: Mapped[str] = mapped_column(String(64))
+    result: Mapped[str] = mapped_column(Text)  # JSON
+    latency: Mapped[float] = mapped_column(Float)  # seconds the original call took
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now())
+
+
+class FSMRecord(Base):
+    __tablename__ = "fsm_states"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    state: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    data: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # JSON
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=func.now())
+
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+
+
+def _async_url(url: str) -> str:
+    # Same database through an asyncio driver: aiosqlite for SQLite, asyncpg for PostgreSQL
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"no async driver for {backend} (DATABASE_URL)")
+    parsed = parsed.set(drivername=_ASYNC_DRIVERS[backend])
+    if "sslmode" in parsed.query:
+        # asyncpg calls it ssl
+        parsed = parsed.update_query_dict({"ssl": parsed.query["sslmode"]}).difference_update_query(["sslmode"])
+    return parsed.render_as_string(hide_password=False)
+
+
+def _pool_options(url: str) -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        "pool_pre_ping": _config.db_pool_pre_ping,
+        "pool_recycle": int(_config.db_pool_recycle),
+    }
+    if make_url(url).get_backend_name() != "sqlite":
+        options["pool_size"] = _config.db_pool_size
+        options["max_overflow"] = _config.db_max_overflow
+    return options
+
+
 _config = load_config()
-_engine = create_engine(_config.database_url, future=True)
+# Sync engine for startup, CLI tools and code that already runs in worker threads
+_engine = create_engine(_config.database_url, future=True, **_pool_options(_config.database_url))
 SessionLocal = sessionmaker(bind=_engine, autoflush=False, autocommit=False, expire_on_commit=False, future=True)
+# Async engine for the handlers: a slow query no longer blocks the event loop
+_async_engine = create_async_engine(_async_url(_config.database_url), **_pool_options(_config.database_url))
+AsyncSessionLocal = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False)
+
+IS_SQLITE = make_url(_config.database_url).get_backend_name() == "sqlite"
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # WAL lets readers run alongside the writer; NORMAL syncs at checkpoints, not on every commit
+    pragmas = [
+        f"PRAGMA busy_timeout={int(_config.sqlite_busy_timeout * 1000)}",
+        f"PRAGMA mmap_size={_config.sqlite_mmap_size}",
+        f"PRAGMA cache_size=-{_config.sqlite_cache_kb}",
+    ]
+    if _config.sqlite_wal:
+        pragmas += ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"]
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _sqlite_async_connect(dbapi_connection, connection_record) -> None:
+    # The driver's own transaction handling breaks SAVEPOINT; begin explicitly instead
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_async_begin(conn) -> None:
+    conn.exec_driver_sql("BEGIN")
+
+
+if IS_SQLITE:
+    event.listen(_engine, "connect", _sqlite_pragmas)
+    event.listen(_async_engine.sync_engine, "connect", _sqlite_pragmas)
+    event.listen(_async_engine.sync_engine, "connect", _sqlite_async_connect)
+    event.listen(_async_engine.sync_engine, "begin", _sqlite_async_begin)
+
+
+def _add_missing_columns() -> None:
+    # create_all() does not alter existing tables: add new nullable columns by hand
+    insp = inspect(_engine)
+    with _engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=_engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
 
 
 def init_db() -> None:
-    Base.metadata.create_all(_engine)
\ No newline at end of file
+    Base.metadata.create_all(_engine)
+    _add_missing_columns()
+
+
+async def close_db() -> None:
+    await _async_engine.dispose()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import load_config
+from .db import AsyncSessionLocal, IS_SQLITE
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+# SQLite allows one writer at a time. Instead of every handler committing on its own
+# (and waiting on the lock), writes are queued to a single task that runs whatever has
+# piled up in one transaction, each write in its own savepoint, and commits once.
+
+T = TypeVar("T")
+Job = Callable[[AsyncSession], Awaitable[Any]]
+
+
+@dataclass
+class _Write:
+    job: Job
+    future: asyncio.Future
+
+
+_queue: Optional[asyncio.Queue] = None
+_task: Optional[asyncio.Task] = None
+_stats: Dict[str, float] = {"writes": 0, "batches": 0, "failed": 0, "max_batch": 0, "commit_seconds": 0.0}
+
+
+def _start() -> asyncio.Queue:
+    global _queue, _task
+    if _queue is None:
+        _queue = asyncio.Queue()
+        _task = asyncio.create_task(_writer())
+    return _queue
+
+
+async def _run_batch(batch: List[_Write]) -> None:
+    outcomes: List[Optional[tuple]] = []
+    started = time.monotonic()
+    async with AsyncSessionLocal() as db:
+        for w in batch:
+            if w.future.done():
+                # The caller gave up before its turn
+                outcomes.append(None)
+                continue
+            try:
+                async with db.begin_nested():
+                    result = await w.job(db)
+            except Exception as e:
+                # Only this write's savepoint is rolled back
+                outcomes.append((False, e))
+            else:
+                outcomes.append((True, result))
+        try:
+            await db.commit()
+        except Exception as e:
+            logger.exception("db writer: commit of %d writes failed", len(batch))
+            outcomes = [(False, e)] * len(batch)
+    _stats["commit_seconds"] += time.monotonic() - started
+    _stats["batches"] += 1
+    _stats["max_batch"] = max(_stats["max_batch"], len(batch))
+    for w, outcome in zip(batch, outcomes):
+        if outcome is None or w.future.done():
+            continue
+        _stats["writes"] += 1
+        ok, value = outcome
+        if ok:
+            w.future.set_result(value)
+        else:
+            _stats["failed"] += 1
+            w.future.set_exception(value)
+
+
+async def _writer() -> None:
+    assert _queue is not None
+    while True:
+        batch: List[_Write] = [await _queue.get()]
+        while len(batch) < _config.db_write_batch and not _queue.empty():
+            batch.append(_queue.get_nowait())
+        try:
+            await _run_batch(batch)
+        except asyncio.CancelledError:
+            for w in batch:
+                w.future.cancel()
+            raise
+        except Exception as e:
+            logger.exception("db writer: batch failed")
+            for w in batch:
+                if not w.future.done():
+                    w.future.set_exception(e)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+async def write(job: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    # Runs job(session) and commits; the result is returned once the commit is done
+    if not (IS_SQLITE and _config.db_single_writer):
+        async with AsyncSessionLocal() as db:
+            result = await job(db)
+            await db.commit()
+            return result
+    future: asyncio.Future = asyncio.get_running_loop().create_future()
+    _start().put_nowait(_Write(job, future))
+    return await future
+
+
+def db_writer_stats() -> Dict[str, float]:
+    batches = _stats["batches"]
+    return {
+        **_stats,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "avg_batch": round(_stats["writes"] / batches, 2) if batches else 0.0,
+    }
+
+
+async def close_db_writer(timeout: float = 10.0) -> None:
+    global _queue, _task
+    if _queue is None or _task is None:
+        return
+    try:
+        # Let the queued writes land before the engine goes away
+        await asyncio.wait_for(_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("db writer: %d writes dropped on shutdown", _queue.qsize())
+    _task.cancel()
+    await asyncio.gather(_task, return_exceptions=True)
+    _queue = _task = None
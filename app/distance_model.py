@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from .db import SessionLocal, RouteCacheEntry
+
+
+logger = logging.getLogger(__name__)
+
+# Road distance / straight-line distance learned from real routes (Yandex/OSRM)
+_REAL_PROVIDERS = ("yandex", "osrm")
+_BANDS_KM = np.array([5.0, 20.0, 50.0, 150.0])  # band edges of the straight-line distance
+_MIN_SAMPLES = 5
+_DEFAULT_FACTOR = 1.3
+
+# key -> [sum_road_km, sum_straight_km, count]; keys: ("band", b), ("region", cell, b), ("all",)
+_sums: Dict[tuple, List[float]] = {}
+
+
+def haversine_km_many(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    h = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371.0 * np.arcsin(np.sqrt(h))
+
+
+def _band(straight_km: float) -> int:
+    return int(np.searchsorted(_BANDS_KM, straight_km, side="right"))
+
+
+def _region(coord: Tuple[float, float]) -> str:
+    # One-degree cell of the origin point
+    return f"{int(np.floor(coord[0]))},{int(np.floor(coord[1]))}"
+
+
+def _keys(coord_from: Tuple[float, float], straight_km: float) -> List[tuple]:
+    b = _band(straight_km)
+    return [("region", _region(coord_from), b), ("band", b), ("all",)]
+
+
+def _add(sums: Dict[tuple, List[float]], key: tuple, road_km: float, straight_km: float, count: float = 1) -> None:
+    acc = sums.setdefault(key, [0.0, 0.0, 0.0])
+    acc[0] += road_km
+    acc[1] += straight_km
+    acc[2] += count
+
+
+def detour_factor(coord_from: Tuple[float, float], straight_km: float) -> float:
+    for key in _keys(coord_from, straight_km):
+        acc = _sums.get(key)
+        if acc and acc[2] >= _MIN_SAMPLES and acc[1] > 0:
+            return acc[0] / acc[1]
+    return _DEFAULT_FACTOR
+
+
+def estimate_km(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> float:
+    straight = float(haversine_km_many(coord_from[0], coord_from[1], coord_to[0], coord_to[1]))
+    return round(straight * detour_factor(coord_from, straight), 3)
+
+
+def observe(coord_from: Tuple[float, float], coord_to: Tuple[float, float], road_km: float) -> None:
+    straight = float(haversine_km_many(coord_from[0], coord_from[1], coord_to[0], coord_to[1]))
+    if straight < 0.05 or road_km <= 0:
+        return
+    for key in _keys(coord_from, straight):
+        _add(_sums, key, road_km, straight)
+
+
+def fit(samples: Iterable[Tuple[float, float, float, float, float]]) -> Dict[tuple, List[float]]:
+    # samples: (lat_from, lon_from, lat_to, lon_to, road_km)
+    arr = np.asarray(list(samples), dtype=float).reshape(-1, 5)
+    sums: Dict[tuple, List[float]] = {}
+    if not len(arr):
+        return sums
+    straight = haversine_km_many(arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3])
+    road = arr[:, 4]
+    ok = (straight >= 0.05) & (road > 0)
+    arr, straight, road = arr[ok], straight[ok], road[ok]
+    bands = np.searchsorted(_BANDS_KM, straight, side="right")
+    cells = np.floor(arr[:, :2]).astype(int)
+
+    for b in np.unique(bands):
+        m = bands == b
+        _add(sums, ("band", int(b)), float(road[m].sum()), float(straight[m].sum()), int(m.sum()))
+    region_ids, inverse = np.unique(np.column_stack([cells, bands]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    road_by = np.bincount(inverse, weights=road)
+    straight_by = np.bincount(inverse, weights=straight)
+    count_by = np.bincount(inverse)
+    for i, (lat_cell, lon_cell, b) in enumerate(region_ids):
+        _add(sums, ("region", f"{lat_cell},{lon_cell}", int(b)), float(road_by[i]), float(straight_by[i]), int(count_by[i]))
+    _add(sums, ("all",), float(road.sum()), float(straight.sum()), int(len(road)))
+    return sums
+
+
+def _parse_route_key(key: str) -> Optional[Tuple[float, float, float, float]]:
+    try:
+        a, b = key.split("|")
+        lat1, lon1 = a.split(",")
+        lat2, lon2 = b.split(",")
+        return float(lat1), float(lon1), float(lat2), float(lon2)
+    except ValueError:
+        return None
+
+
+def _load_samples() -> List[Tuple[float, float, float, float, float]]:
+    samples = []
+    with SessionLocal() as db:
+        stmt = select(RouteCacheEntry.key, RouteCacheEntry.distance_km).where(
+            RouteCacheEntry.provider.in_(_REAL_PROVIDERS)
+        )
+        for key, distance_km in db.execute(stmt).yield_per(1000):
+            coords = _parse_route_key(key)
+            if coords:
+                samples.append((*coords, float(distance_km)))
+    return samples
+
+
+def _fit_from_db() -> Dict[tuple, List[float]]:
+    return fit(_load_samples())
+
+
+async def refit() -> None:
+    global _sums
+    try:
+        _sums = await asyncio.to_thread(_fit_from_db)
+        acc = _sums.get(("all",))
+        if acc:
+            logger.info("distance model fitted on %d routes, factor %.3f", acc[2], acc[0] / acc[1])
+    except Exception:
+        logger.exception("distance model fit failed")
@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .geo_cache import normalize_address, STREET_TYPES
+
+
+logger = logging.getLogger(__name__)
+
+# Rule-based extraction for messages that are already structured.
+# Every parser returns the fields together with a confidence in [0, 1]; the caller
+# only goes to the LLM when the confidence is below the configured threshold.
+
+PLATE_RE = re.compile(
+    r"(?<![0-9A-ZА-ЯЁ])([АВЕКМНОРСТУХA-Z]\s?\d{3}\s?[АВЕКМНОРСТУХA-Z]{2}\s?\d{2,3})(?![0-9])",
+    re.IGNORECASE,
+)
+_SEPARATORS_RE = re.compile(r"\s*(?:;|\n|→|->)\s*")
+_LABEL_RE = re.compile(
+    r"(?:^|[;,\n]|\s)(откуда|куда|адрес\s+начал[оа]|адрес\s+конец|начало|конец|номер|машина)\s*[:\-–]\s*",
+    re.IGNORECASE,
+)
+_FROM_TO_RE = re.compile(r"^\s*от\s+(.+?)\s+до\s+(.+?)\s*$", re.IGNORECASE | re.DOTALL)
+_HOUSE_RE = re.compile(r"\b\d+[0-9а-яa-z/-]*\b", re.IGNORECASE)
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_UNIT = r"\s*(т\b|тн\b|тонн\w*|м3|м³|куб\w*)?"
+# Whole words only: "ул. Загрузочная 5" is a street, not a load of 5
+_LOAD_WORD = r"(?<!\w)(?:загрузк[аиуео]й?|загружено|загрузили?|погрузк[аиуео]й?|погружено|погрузили?)(?!\w)"
+_UNLOAD_WORD = r"(?<!\w)(?:выгрузк[аиуео]й?|выгружено|выгрузили?|разгрузк[аиуео]й?|разгружено|разгрузили?|сгрузили?)(?!\w)"
+_CARGO_WORD = r"(?<!\w)(?:тип|груз|материал)(?!\w)"
+_LOAD_RE = re.compile(_LOAD_WORD + r"\s*[:\-–]?\s*" + _NUMBER + _UNIT, re.IGNORECASE)
+_UNLOAD_RE = re.compile(_UNLOAD_WORD + r"\s*[:\-–]?\s*" + _NUMBER + _UNIT, re.IGNORECASE)
+_CARGO_RE = re.compile(_CARGO_WORD + r"\s*[:\-–]\s*([^;,\n]+)", re.IGNORECASE)
+_ANCHOR_RE = re.compile("|".join((_LOAD_WORD, _UNLOAD_WORD, _CARGO_WORD, r"\d")), re.IGNORECASE)
+_AMOUNT_RE = re.compile(r"^" + _NUMBER + _UNIT + r"$", re.IGNORECASE)
+# What makes a line a place rather than any text with a digit in it
+_PLACE_TYPES = STREET_TYPES | {"поселок", "деревня", "село", "область", "район", "корпус", "строение"}
+_TOWN_RE = re.compile(r"(?<!\w)(?:г|гор|город|с|д|дер)\.?\s*[А-ЯЁ]")
+_CITY_FIRST_RE = re.compile(r"^[А-ЯЁ][а-яё-]+(?:\s+[А-ЯЁ][а-яё-]+)?\s*,\s*\S")
+_CITY_LAST_RE = re.compile(r"\S\s*,\s*[А-ЯЁ][а-яё-]+(?:\s+[А-ЯЁ][а-яё-]+)?$")
+_UNIT_AMOUNT_RE = re.compile(_NUMBER + r"\s*(?:т\b|тн\b|тонн\w*|м3|м³|куб\w*)", re.IGNORECASE)
+
+
+def _plate(text: str) -> Optional[str]:
+    m = PLATE_RE.fullmatch(text.strip())
+    return m.group(1).replace(" ", "").upper() if m else None
+
+
+def _looks_like_address(text: str) -> bool:
+    if len(text) < 3 or _plate(text):
+        return False
+    tokens = normalize_address(text).split()
+    return "," in text or bool(_HOUSE_RE.search(text)) or any(t in STREET_TYPES for t in tokens)
+
+
+def _names_place(text: str) -> bool:
+    # A street type, a settlement, or "Город, ..." up front
+    text = text.strip()
+    if _plate(text):
+        return False
+    tokens = normalize_address(text).split()
+    return any(t in _PLACE_TYPES for t in tokens) or bool(
+        _TOWN_RE.search(text) or _CITY_FIRST_RE.match(text) or _CITY_LAST_RE.search(text)
+    )
+
+
+def _address_score(stops: List[str]) -> float:
+    return 0.3 * sum(_names_place(s) for s in stops) / len(stops)
+
+
+def _labelled(text: str) -> Dict[str, str]:
+    found: Dict[str, str] = {}
+    matches = list(_LABEL_RE.finditer(text))
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        value = text[m.end():end].strip(" ;,\n")
+        label = m.group(1).casefold()
+        if label in ("откуда", "начало") or label.endswith(("начало", "начала")):
+            key = "address_from"
+        elif label in ("куда", "конец") or label.endswith("конец"):
+            key = "address_to"
+        else:
+            key = "car_number"
+        if value:
+            found.setdefault(key, value)
+    return found
+
+
+def parse_step1(text: str) -> Tuple[Dict[str, Any], float]:
+    text = text.strip()
+    car_number: Optional[str] = None
+    stops: List[str] = []
+    score = 0.0
+
+    labelled = False
+    labels = _labelled(text)
+    if labels.get("address_from") and labels.get("address_to"):
+        # "номер: ...; откуда: ...; куда: ..."
+        stops = [labels["address_from"], labels["address_to"]]
+        plate = labels.get("car_number")
+        if plate:
+            car_number = _plate(plate) or plate
+        else:
+            m = PLATE_RE.search(text)
+            car_number = m.group(1).replace(" ", "").upper() if m else None
+        score = 0.5
+        labelled = True
+    else:
+        parts = [p for p in _SEPARATORS_RE.split(text) if p]
+        if len(parts) >= 2:
+            # "номер; откуда; [промежуточные;] куда"
+            car_number = _plate(parts[0])
+            if car_number:
+                parts = parts[1:]
+            elif len(parts) >= 3 and not _looks_like_address(parts[0]):
+                car_number = parts.pop(0)
+            if len(parts) >= 2:
+                stops = parts
+                score = 0.5
+        else:
+            m = _FROM_TO_RE.match(text)
+            if m:
+                stops = [m.group(1).strip(), m.group(2).strip()]
+                score = 0.4
+
+    if not stops or any(_UNIT_AMOUNT_RE.search(s) for s in stops):
+        # No route, or an amount ("20 т") was taken for an address
+        return {"car_number": None, "address_from": None, "address_to": None, "stops": None}, 0.0
+    if car_number and _plate(car_number):
+        score += 0.2
+    if labelled:
+        score += 0.3
+    else:
+        score += _address_score(stops)
+        if not all(_names_place(s) for s in stops):
+            # "завтра в 9 утра" is not a stop: let the LLM read the message
+            score = min(score, 0.5)
+    return {
+        "car_number": car_number or None,
+        "address_from": stops[0],
+        "address_to": stops[-1],
+        "stops": stops,
+    }, round(min(score, 1.0), 3)
+
+
+def _amount(m: Optional[re.Match]) -> Tuple[Optional[float], Optional[str]]:
+    if not m:
+        return None, None
+    return float(m.group(1).replace(",", ".")), _unit(m.group(2))
+
+
+def _unit(raw: Optional[str]) -> Optional[str]:
+    if not raw:
+        return None
+    raw = raw.casefold()
+    return "t" if raw.startswith("т") else "m3"
+
+
+def _leading_cargo(text: str) -> Optional[str]:
+    # "ЩПС, загрузка 20, выгрузка 5": free text before the first anchor
+    m = _ANCHOR_RE.search(text)
+    head = (text[:m.start()] if m else text).strip(" ;,.:-\n")
+    if head and len(head.split()) <= 4:
+        return head
+    return None
+
+
+def _tail(text: str) -> str:
+    # Whatever follows the last anchored amount or cargo label
+    ends = [m.end() for pattern in (_LOAD_RE, _UNLOAD_RE, _CARGO_RE) for m in pattern.finditer(text)]
+    return text[max(ends):] if ends else ""
+
+
+def _trailing_cargo(text: str) -> Optional[str]:
+    # "загрузка 20, выгрузка 5, щебень": a few plain words after the last anchor,
+    # in the same part of the message (a separate part may be the route)
+    if _CARGO_RE.search(text):
+        return None
+    tail = _tail(text).strip(" ;,.:-\n")
+    if not tail or len(tail.split()) > 4 or re.search(r"[;,\n→]|->", tail):
+        return None
+    if _ANCHOR_RE.search(tail) or _names_place(tail):
+        return None
+    return tail
+
+
+def _leftover(text: str) -> str:
+    # Text that none of the amount and cargo patterns accounted for
+    for pattern in (_LOAD_RE, _UNLOAD_RE, _CARGO_RE):
+        text = pattern.sub(" ", text)
+    return re.sub(r"[\s;,.:\-–]+", " ", text).strip()
+
+
+def parse_step2(text: str, standalone: bool = True) -> Tuple[Dict[str, Any], float]:
+    # standalone=False: the text also carries the route, so only anchored amounts count
+    text = text.strip()
+    load_amount, load_unit = _amount(_LOAD_RE.search(text))
+    unload_amount, unload_unit = _amount(_UNLOAD_RE.search(text))
+    m = _CARGO_RE.search(text)
+    cargo_type = m.group(1).strip() if m else None
+    score = 0.0
+
+    if load_amount is not None or unload_amount is not None:
+        score += 0.4 * (load_amount is not None) + 0.4 * (unload_amount is not None)
+        if standalone:
+            cargo_type = cargo_type or _leading_cargo(text) or _trailing_cargo(text)
+            if not cargo_type and _leftover(text):
+                # Some words were not understood: maybe the cargo, let the LLM look
+                score = min(score, 0.6)
+        else:
+            cargo_type = cargo_type or _trailing_cargo(text)
+            if not cargo_type and _SEPARATORS_RE.split(_tail(text))[0].strip(" ,.:-"):
+                # Words right after the amounts that are neither cargo nor a route part
+                score = min(score, 0.6)
+    elif standalone:
+        # "ЩПС; 20; 5" or "20 т; 5 т": cargo first, then load and unload
+        parts = [p for p in _SEPARATORS_RE.split(text) if p]
+        amounts = [_AMOUNT_RE.match(p) for p in parts]
+        numeric = [a for a in amounts if a]
+        others = [p for p, a in zip(parts, amounts) if not a]
+        if len(numeric) == 2 and len(others) <= 1:
+            (load_amount, load_unit), (unload_amount, unload_unit) = _amount(numeric[0]), _amount(numeric[1])
+            cargo_type = cargo_type or (others[0] if others else None)
+            score = 0.7
+
+    if cargo_type:
+        score += 0.2
+    if load_unit and unload_unit and load_unit != unload_unit:
+        # "20 т" against "5 м3" is probably not a load/unload pair
+        score -= 0.3
+    return {
+        "cargo_type": cargo_type,
+        "load_amount": load_amount,
+        "unload_amount": unload_amount,
+    }, round(max(0.0, min(score, 1.0)), 3)
+
+
+def split_cargo(text: str) -> Tuple[str, bool]:
+    # Route part of a message that may also carry cargo and amounts
+    rest = text
+    cargo = _trailing_cargo(text)
+    if cargo:
+        # "..., загрузка 20 выгрузка 5 щебень": the cargo word is not part of the route
+        rest = rest.rstrip(" ;,.:-\n")[:-len(cargo)]
+    for pattern in (_LOAD_RE, _UNLOAD_RE, _CARGO_RE):
+        rest = pattern.sub(" ", rest)
+    rest = re.sub(r"(?:\s*[;,]\s*)+$", "", rest.strip())
+    return rest, rest != text.strip()
+
+
+def parse_order(text: str) -> Tuple[Dict[str, Any], float]:
+    # All six fields from one message: "А123ВС77; Тверская 1; Арбат 10; груз: ЩПС; загрузка 20; выгрузка 5"
+    cargo, cargo_confidence = parse_step2(text, standalone=False)
+    route_text, has_cargo = split_cargo(text)
+    route, route_confidence = parse_step1(route_text)
+    if not has_cargo:
+        # Plain step-1 message: the cargo is asked for separately
+        return {**route, **cargo}, route_confidence
+    return {**route, **cargo}, min(route_confidence, cargo_confidence)
+
+
+def parse_labelled(text: str) -> Dict[str, Any]:
+    # Only the fields the text names explicitly: "откуда: ...", "номер: ...", "загрузка 20", "груз: ЩПС"
+    found: Dict[str, Any] = {}
+    route_text, _ = split_cargo(text)
+    for key, value in _labelled(route_text).items():
+        found[key] = (_plate(value) or value) if key == "car_number" else value
+    load_amount, _ = _amount(_LOAD_RE.search(text))
+    unload_amount, _ = _amount(_UNLOAD_RE.search(text))
+    m = _CARGO_RE.search(text)
+    found.update(
+        load_amount=load_amount,
+        unload_amount=unload_amount,
+        cargo_type=m.group(1).strip() if m else None,
+    )
+    return {k: v for k, v in found.items() if v is not None}
+
+
+_stats: Dict[str, Dict[str, int]] = {}
+_REPORT_EVERY = 100
+
+
+def record(step: str, fast: bool) -> None:
+    st = _stats.setdefault(step, {"fast": 0, "llm": 0})
+    st["fast" if fast else "llm"] += 1
+    total = st["fast"] + st["llm"]
+    if total % _REPORT_EVERY == 0:
+        logger.info("fast path %s: %d of %d messages (%.0f%%)", step, st["fast"], total, 100.0 * st["fast"] / total)
+
+
+def fast_path_stats() -> Dict[str, Dict[str, float]]:
+    result: Dict[str, Dict[str, float]] = {}
+    for step, st in _stats.items():
+        total = st["fast"] + st["llm"]
+        result[step] = {**st, "win_rate": round(st["fast"] / total, 3) if total else 0.0}
+    return result
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete
+
+from . import db_writer
+from .cache import TTLCache
+from .config import load_config
+from .db import AsyncSessionLocal, FSMRecord
+from .geo_cache import is_fresh
+
+
+_config = load_config()
+
+_Row = Tuple[Optional[str], Dict[str, Any]]
+_KEEP = object()
+
+
+def _pk(key: StorageKey) -> Tuple[int, int, int]:
+    return key.bot_id, key.chat_id, key.user_id
+
+
+async def _load(pk: Tuple[int, int, int]) -> _Row:
+    async with AsyncSessionLocal() as db:
+        row = await db.get(FSMRecord, pk)
+    if row is None or not is_fresh(row.updated_at, _config.fsm_ttl):
+        # Nothing stored, or an abandoned draft (the row is left to purge_expired)
+        return None, {}
+    return row.state, json.loads(row.data) if row.data else {}
+
+
+async def _save(pk: Tuple[int, int, int], state: Any = _KEEP, data: Any = _KEEP) -> _Row:
+    async def _job(db) -> _Row:
+        row = await db.get(FSMRecord, pk)
+        if row is None:
+            row = FSMRecord(bot_id=pk[0], chat_id=pk[1], user_id=pk[2])
+            db.add(row)
+        elif not is_fresh(row.updated_at, _config.fsm_ttl):
+            # Start over instead of reviving the expired half of the draft
+            row.state = row.data = None
+        if state is not _KEEP:
+            row.state = state
+        if data is not _KEEP:
+            row.data = json.dumps(data, ensure_ascii=False) if data else None
+        if row.state is None and row.data is None:
+            # Cleared conversation: no row at all
+            if row in db.new:
+                db.expunge(row)
+            else:
+                await db.delete(row)
+        else:
+            row.updated_at = datetime.now(timezone.utc)
+        return row.state, json.loads(row.data) if row.data else {}
+
+    return await db_writer.write(_job)
+
+
+class SQLStorage(BaseStorage):
+    # FSM state and data in the fsm_states table, keyed by (bot, chat, user).
+    # Writes go to the database first and then to a short-lived in-process cache,
+    # which only saves the repeated reads within one update.
+    def __init__(self) -> None:
+        self._cache = TTLCache(maxsize=_config.fsm_cache_size, ttl=_config.fsm_cache_ttl)
+
+    async def _get(self, key: StorageKey) -> _Row:
+        pk = _pk(key)
+        row = self._cache.get(pk)
+        if row is None:
+            row = await _load(pk)
+            self._cache.set(pk, row)
+        return row
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        pk = _pk(key)
+        self._cache.set(pk, await _save(pk, state=value))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        pk = _pk(key)
+        self._cache.set(pk, await _save(pk, data=dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._get(key))[1])
+
+    async def close(self) -> None:
+        self._cache.clear()
+
+
+async def purge_expired() -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=_config.fsm_ttl)
+
+    async def _job(db) -> int:
+        res = await db.execute(delete(FSMRecord).where(FSMRecord.updated_at < cutoff))
+        return res.rowcount or 0
+
+    return await db_writer.write(_job)
@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import mmap
+import re
+import struct
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .config import load_config
+from .geo_cache import normalize_address, STREET_TYPES
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+# Offline geocoder over a local address extract.
+#
+# File layout (little-endian), built by `python -m app.gazetteer build`:
+#   header
+#   streets:  n_streets x (name_off, name_len, city_off, city_len, house_start, house_count, n_tokens, is_street);
+#             settlements without streets are stored as is_street=0 entries named after the settlement
+#   houses:   n_houses  x (str_off, str_len, lat, lon), sorted by house string within a street;
+#             the "" house of each street is its centroid
+#   tokens:   n_tokens  x (str_off, str_len, post_start, post_count), sorted by token bytes
+#   postings: street ids per token
+#   strings:  utf-8 blob
+# The file is memory-mapped, so loading is instant and lookups only touch the pages they need.
+
+_MAGIC = b"GAZ1"
+_HEADER = struct.Struct("<4sIIII5Q")
+_STREET = struct.Struct("<8I")
+_HOUSE = struct.Struct("<IIdd")
+_TOKEN = struct.Struct("<4I")
+_POSTING = struct.Struct("<I")
+
+_HOUSE_RE = re.compile(r"^\d+[0-9a-zа-я/-]*$")
+_ORDINAL_RE = re.compile(r"^\d+-?(я|й|е|ая|ой|ий|ый)$")
+# Words that may accompany a city in a query without naming a different one
+_REGION_WORDS = {"россия", "область", "край", "район", "республика", "округ"}
+
+
+def _street_tokens(street: str) -> List[str]:
+    return sorted({t for t in normalize_address(street).split() if t not in STREET_TYPES})
+
+
+def _normalize_house(house: str) -> str:
+    s = re.sub(r"[\s.]+", "", house.casefold())
+    s = re.sub(r"корпус|корп", "к", s)
+    return re.sub(r"строение|стр", "с", s)
+
+
+def _split_query(address: str) -> Tuple[List[str], str]:
+    tokens = [t for t in normalize_address(address).split() if t not in STREET_TYPES]
+    house = ""
+    for i in range(len(tokens) - 1, -1, -1):
+        if _HOUSE_RE.match(tokens[i]) and not _ORDINAL_RE.match(tokens[i]):
+            house = tokens.pop(i)
+            # "5 корпус 2" -> "5к2"
+            rest = tokens[i:]
+            if len(rest) >= 2 and rest[0] in ("корпус", "строение") and rest[1].isdigit():
+                house += ("к" if rest[0] == "корпус" else "с") + rest[1]
+                del tokens[i:i + 2]
+            break
+    return tokens, house
+
+
+def _house_number(house: str) -> Optional[int]:
+    m = re.match(r"\d+", house)
+    return int(m.group(0)) if m else None
+
+
+class Gazetteer:
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, _, self.n_streets, self.n_houses, self.n_tokens,
+         self._off_streets, self._off_houses, self._off_tokens, self._off_postings, self._off_strings) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path}: not a gazetteer file")
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def _bytes(self, off: int, length: int) -> bytes:
+        start = self._off_strings + off
+        return self._mm[start:start + length]
+
+    def _street(self, sid: int) -> Tuple[int, ...]:
+        return _STREET.unpack_from(self._mm, self._off_streets + sid * _STREET.size)
+
+    def _house(self, hid: int) -> Tuple[bytes, float, float]:
+        off, length, lat, lon = _HOUSE.unpack_from(self._mm, self._off_houses + hid * _HOUSE.size)
+        return self._bytes(off, length), lat, lon
+
+    def _postings(self, token: str) -> List[int]:
+        key = token.encode("utf-8")
+        lo, hi = 0, self.n_tokens
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off, length, start, count = _TOKEN.unpack_from(self._mm, self._off_tokens + mid * _TOKEN.size)
+            value = self._bytes(off, length)
+            if value < key:
+                lo = mid + 1
+            elif value > key:
+                hi = mid
+            else:
+                base = self._off_postings + start * _POSTING.size
+                return [_POSTING.unpack_from(self._mm, base + i * _POSTING.size)[0] for i in range(count)]
+        return []
+
+    def _find_house(self, start: int, count: int, house: str) -> Tuple[float, float]:
+        key = house.encode("utf-8")
+        lo, hi = start, start + count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._house(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < start + count:
+            value, lat, lon = self._house(lo)
+            if value == key:
+                return lat, lon
+        # No exact match: closest house number on the street, else the street centroid
+        wanted = _house_number(house)
+        best: Optional[Tuple[int, float, float]] = None
+        if wanted is not None:
+            for hid in range(start, start + count):
+                value, lat, lon = self._house(hid)
+                number = _house_number(value.decode("utf-8"))
+                if number is not None and (best is None or abs(number - wanted) < best[0]):
+                    best = (abs(number - wanted), lat, lon)
+        if best:
+            return best[1], best[2]
+        _, lat, lon = self._house(start)
+        return lat, lon
+
+    def lookup(self, address: str) -> Optional[Tuple[float, float]]:
+        tokens, house = _split_query(address)
+        if not tokens:
+            return None
+        hits: Dict[int, int] = defaultdict(int)
+        for token in set(tokens):
+            for sid in self._postings(token):
+                hits[sid] += 1
+        query = set(tokens)
+        best: Optional[Tuple[Tuple[int, int, int], int]] = None
+        for sid, n in hits.items():
+            name_off, name_len, city_off, city_len, _, _, n_tokens, is_street = self._street(sid)
+            if n < n_tokens:
+                continue
+            city = self._bytes(city_off, city_len).decode("utf-8")
+            city_match = 1 if not is_street or (city and set(city.split()) <= query) else 0
+            if not city_match:
+                # "Казань, Тверская 3" must not land on Тверская in Moscow:
+                # a street elsewhere only counts when the query names no city at all
+                street = set(self._bytes(name_off, name_len).decode("utf-8").split())
+                if query - street - _REGION_WORDS:
+                    continue
+            # Street in the named city > the settlement itself > same street name elsewhere
+            score = (city_match, is_street, n_tokens)
+            if best is None or score > best[0]:
+                best = (score, sid)
+        if best is None:
+            return None
+        _, _, _, _, house_start, house_count, _, _ = self._street(best[1])
+        return self._find_house(house_start, house_count, house)
+
+
+def _pick(row: Dict[str, str], *names: str) -> str:
+    for name in names:
+        value = row.get(name)
+        if value:
+            return value.strip()
+    return ""
+
+
+def build(csv_path: str, out_path: str) -> Tuple[int, int]:
+    # CSV columns: city, street, housenumber, lat, lon (OSM "addr:*" names are accepted too)
+    # (is_street, city, street key) -> house -> coord
+    streets: Dict[Tuple[int, str, str], Dict[str, Tuple[float, float]]] = defaultdict(dict)
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                lat = float(_pick(row, "lat", "latitude", "y"))
+                lon = float(_pick(row, "lon", "longitude", "x"))
+            except ValueError:
+                continue
+            city = normalize_address(_pick(row, "city", "addr:city", "settlement"))
+            tokens = _street_tokens(_pick(row, "street", "addr:street"))
+            if tokens:
+                house = _normalize_house(_pick(row, "housenumber", "house", "addr:housenumber"))
+                streets[(1, city, " ".join(tokens))][house] = (lat, lon)
+            elif city:
+                streets[(0, "", city)][""] = (lat, lon)
+
+    strings = bytearray()
+    string_offsets: Dict[str, Tuple[int, int]] = {}
+
+    def _str(value: str) -> Tuple[int, int]:
+        if value not in string_offsets:
+            data = value.encode("utf-8")
+            string_offsets[value] = (len(strings), len(data))
+            strings.extend(data)
+        return string_offsets[value]
+
+    street_rows = bytearray()
+    house_rows = bytearray()
+    postings: Dict[str, List[int]] = defaultdict(list)
+    n_houses = 0
+    for sid, ((is_street, city, key), houses) in enumerate(sorted(streets.items())):
+        if "" not in houses:
+            lats = [c[0] for c in houses.values()]
+            lons = [c[1] for c in houses.values()]
+            houses[""] = (sum(lats) / len(lats), sum(lons) / len(lons))
+        ordered = sorted(houses.items(), key=lambda kv: kv[0].encode("utf-8"))
+        name_off, name_len = _str(key)
+        city_off, city_len = _str(city)
+        tokens = key.split()
+        street_rows += _STREET.pack(name_off, name_len, city_off, city_len, n_houses, len(ordered), len(tokens), is_street)
+        for house, (lat, lon) in ordered:
+            h_off, h_len = _str(house)
+            house_rows += _HOUSE.pack(h_off, h_len, lat, lon)
+        n_houses += len(ordered)
+        for token in tokens:
+            postings[token].append(sid)
+
+    token_rows = bytearray()
+    posting_rows = bytearray()
+    n_postings = 0
+    for token in sorted(postings, key=lambda t: t.encode("utf-8")):
+        t_off, t_len = _str(token)
+        ids = postings[token]
+        token_rows += _TOKEN.pack(t_off, t_len, n_postings, len(ids))
+        for sid in ids:
+            posting_rows += _POSTING.pack(sid)
+        n_postings += len(ids)
+
+    off_streets = _HEADER.size
+    off_houses = off_streets + len(street_rows)
+    off_tokens = off_houses + len(house_rows)
+    off_postings = off_tokens + len(token_rows)
+    off_strings = off_postings + len(posting_rows)
+    with open(out_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, 1, len(streets), n_houses, len(postings),
+                             off_streets, off_houses, off_tokens, off_postings, off_strings))
+        f.write(street_rows)
+        f.write(house_rows)
+        f.write(token_rows)
+        f.write(posting_rows)
+        f.write(strings)
+    return len(streets), n_houses
+
+
+_instance: Optional[Gazetteer] = None
+_load_failed = False
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    global _instance, _load_failed
+    if _instance is None and not _load_failed and _config.gazetteer_path:
+        try:
+            _instance = Gazetteer(_config.gazetteer_path)
+        except Exception:
+            _load_failed = True
+            logger.exception("gazetteer %s not loaded", _config.gazetteer_path)
+    return _instance
+
+
+def gazetteer_geocode(address: str) -> Optional[Tuple[float, float]]:
+    gz = get_gazetteer()
+    if gz is None:
+        return None
+    try:
+        return gz.lookup(address)
+    except Exception:
+        logger.exception("gazetteer lookup failed")
+        return None
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser(prog="python -m app.gazetteer", description="Офлайн-справочник адресов")
+    sub = p.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="собрать индекс из CSV (city,street,housenumber,lat,lon)")
+    p_build.add_argument("csv_path")
+    p_build.add_argument("out_path")
+    p_lookup = sub.add_parser("lookup", help="найти адрес в индексе")
+    p_lookup.add_argument("path")
+    p_lookup.add_argument("address")
+    args = p.parse_args()
+    if args.command == "build":
+        n_streets, n_houses = build(args.csv_path, args.out_path)
+        print(f"Улиц: {n_streets}, домов: {n_houses}")
+    else:
+        gz = Gazetteer(args.path)
+        print(gz.lookup(args.address))
+        gz.close()
+
+
+if __name__ == "__main__":
+    main()
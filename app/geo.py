@@ -1,123 +1,344 @@
 from __future__ import annotations
 
-import math
-from typing import Tuple, Optional
+import asyncio
+from typing import List, Tuple, Optional
 
-import requests
+import httpx
 
+from . import distance_model
 from .config import load_config
+from .ratelimit import acquire
+from .resilience import first_valid
+from .gazetteer import gazetteer_geocode
+from .geo_cache import lookup_geocode, store_geocode, lookup_route, store_route
+from .locations import resolve_known, matrix_distance
 
 
 _config = load_config()
 
+_http: Optional[httpx.AsyncClient] = None
 
-def geocode_address(address: str) -> Optional[Tuple[float, float]]:
-    # Yandex Geocoder first
-    if _config.yandex_maps_api_key:
-        try:
-            url = "https://geocode-maps.yandex.ru/1.x"
-            params = {
-                "apikey": _config.yandex_maps_api_key,
-                "format": "json",
-                "geocode": address,
-                "lang": "ru_RU",
-                "results": 1,
-            }
-            resp = requests.get(url, params=params, timeout=20)
-            resp.raise_for_status()
-            data = resp.json()
-            members = (
-                data.get("response", {})
-                .get("GeoObjectCollection", {})
-                .get("featureMember", [])
-            )
-            if members:
-                pos = (
-                    members[0]
-                    .get("GeoObject", {})
-                    .get("Point", {})
-                    .get("pos", "")
-                )
-                if pos:
-                    lon_str, lat_str = pos.split()
-                    return float(lat_str), float(lon_str)
-        except Exception:
-            pass
-    # Fallback: Nominatim
-    try:
-        resp = requests.get(
-            "https://nominatim.openstreetmap.org/search",
-            params={"q": address, "format": "json", "limit": 1},
-            headers={"User-Agent": "vc2nt-bot/1.0"},
-            timeout=20,
+
+def _client() -> httpx.AsyncClient:
+    # One pooled client per process: keeps TLS connections to the providers alive
+    global _http
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            timeout=httpx.Timeout(_config.geo_http_timeout, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=_config.geo_http_max_connections,
+                max_keepalive_connections=_config.geo_http_max_connections,
+                keepalive_expiry=30.0,
+            ),
+        )
+    return _http
+
+
+async def close_http_client() -> None:
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
+async def _yandex_geocode(address: str) -> Optional[Tuple[float, float]]:
+    await acquire("yandex_geocoder")
+    params = {
+        "apikey": _config.yandex_maps_api_key,
+        "format": "json",
+        "geocode": address,
+        "lang": "ru_RU",
+        "results": 1,
+    }
+    resp = await _client().get("https://geocode-maps.yandex.ru/1.x", params=params)
+    resp.raise_for_status()
+    data = resp.json()
+    members = (
+        data.get("response", {})
+        .get("GeoObjectCollection", {})
+        .get("featureMember", [])
+    )
+    if members:
+        pos = (
+            members[0]
+            .get("GeoObject", {})
+            .get("Point", {})
+            .get("pos", "")
         )
-        resp.raise_for_status()
-        data = resp.json()
-        if data:
-            return float(data[0]["lat"]), float(data[0]["lon"])  # type: ignore
-    except Exception:
-        pass
+        if pos:
+            lon_str, lat_str = pos.split()
+            return float(lat_str), float(lon_str)
     return None
 
 
-def route_distance_km(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> float:
-    # Prefer Yandex Routing
+async def _nominatim_geocode(address: str) -> Optional[Tuple[float, float]]:
+    await acquire("nominatim")
+    resp = await _client().get(
+        "https://nominatim.openstreetmap.org/search",
+        params={"q": address, "format": "json", "limit": 1},
+        headers={"User-Agent": "vc2nt-bot/1.0"},
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    if data:
+        return float(data[0]["lat"]), float(data[0]["lon"])  # type: ignore
+    return None
+
+
+def _hedge_delay() -> Optional[float]:
+    return _config.geo_hedge_delay if _config.geo_hedge else None
+
+
+async def _geocode_uncached(address: str) -> Optional[Tuple[Tuple[float, float], str]]:
+    if _config.gazetteer_mode == "first":
+        coord = gazetteer_geocode(address)
+        if coord:
+            return coord, "gazetteer"
+    # Yandex Geocoder first, then Nominatim
+    calls = []
     if _config.yandex_maps_api_key:
-        try:
-            url = "https://api.routing.yandex.net/v2/route"
-            waypoints = f"{coord_from[1]},{coord_from[0]}|{coord_to[1]},{coord_to[0]}"
-            params = {
-                "apikey": _config.yandex_maps_api_key,
-                "waypoints": waypoints,
-                "mode": "driving",
-                "lang": "ru_RU",
-            }
-            resp = requests.get(url, params=params, timeout=20)
-            resp.raise_for_status()
-            data = resp.json()
-            distance_m = None
-            routes = data.get("routes") if isinstance(data, dict) else None
-            if routes:
-                r0 = routes[0]
-                legs = r0.get("legs") if isinstance(r0, dict) else None
-                if legs and isinstance(legs, list) and legs:
-                    dist_obj = legs[0].get("distance") if isinstance(legs[0], dict) else None
-                    if isinstance(dist_obj, dict):
-                        distance_m = dist_obj.get("value") or dist_obj.get("meters")
+        calls.append(("yandex_geocoder", lambda: _yandex_geocode(address)))
+    calls.append(("nominatim", lambda: _nominatim_geocode(address)))
+    found = await first_valid(calls, _hedge_delay())
+    if not found:
+        # Offline last resort (e.g. during provider outages)
+        coord = gazetteer_geocode(address) if _config.gazetteer_mode != "first" else None
+        return (coord, "gazetteer") if coord else None
+    coord, name = found
+    return coord, _provider_name(name)
+
+
+async def geocode_with_provider(
+    address: str, use_cache: bool = True
+) -> Optional[Tuple[Tuple[float, float], Optional[str]]]:
+    known = resolve_known(address)
+    if known:
+        return known, "known"
+    cached = await lookup_geocode(address) if use_cache else None
+    if cached:
+        return cached
+    found = await _geocode_uncached(address)
+    # Offline answers are not cached so that a provider answer can replace them later
+    if found and found[1] != "gazetteer":
+        await store_geocode(address, found[0], found[1])
+    return found
+
+
+async def geocode_address(address: str) -> Optional[Tuple[float, float]]:
+    found = await geocode_with_provider(address)
+    return found[0] if found else None
+
+
+async def geocode_many(addresses: List[str]) -> List[Optional[Tuple[Tuple[float, float], Optional[str]]]]:
+    # All addresses concurrently; each result is (coord, provider) or None
+    return list(await asyncio.gather(*[geocode_with_provider(a) for a in addresses]))
+
+
+async def _yandex_route_legs(coords: List[Tuple[float, float]]) -> Optional[List[float]]:
+    await acquire("yandex_routing")
+    waypoints = "|".join(f"{c[1]},{c[0]}" for c in coords)
+    params = {
+        "apikey": _config.yandex_maps_api_key,
+        "waypoints": waypoints,
+        "mode": "driving",
+        "lang": "ru_RU",
+    }
+    resp = await _client().get("https://api.routing.yandex.net/v2/route", params=params)
+    resp.raise_for_status()
+    data = resp.json()
+    routes = data.get("routes") if isinstance(data, dict) else None
+    if routes:
+        r0 = routes[0]
+        legs = r0.get("legs") if isinstance(r0, dict) else None
+        distances = []
+        if legs and isinstance(legs, list):
+            for leg in legs:
+                dist_obj = leg.get("distance") if isinstance(leg, dict) else None
+                distance_m = (dist_obj.get("value") or dist_obj.get("meters")) if isinstance(dist_obj, dict) else None
                 if distance_m is None:
-                    distance_m = r0.get("distance")
-            if distance_m is not None:
-                return round(float(distance_m) / 1000.0, 3)
-        except Exception:
-            pass
-    # OSRM fallback
-    try:
-        url = (
-            f"https://router.project-osrm.org/route/v1/driving/"
-            f"{coord_from[1]},{coord_from[0]};{coord_to[1]},{coord_to[0]}"
-        )
-        resp = requests.get(url, params={"overview": "false"}, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
-        routes = data.get("routes") or []
-        if routes:
-            distance_m = routes[0].get("distance", 0)
-            return round(float(distance_m) / 1000.0, 3)
-    except Exception:
-        pass
-    # Haversine fallback
-    return round(haversine_km(coord_from, coord_to), 3)
-
-
-def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
-    lat1, lon1 = a
-    lat2, lon2 = b
-    r = 6371.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    h = (
-        math.sin(dphi / 2) ** 2
-        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    )
-    return 2 * r * math.asin(math.sqrt(h))
\ No newline at end of file
+                    break
+                distances.append(round(float(distance_m) / 1000.0, 3))
+        if len(distances) == len(coords) - 1:
+            return distances
+        if len(coords) == 2 and r0.get("distance") is not None:
+            return [round(float(r0.get("distance")) / 1000.0, 3)]
+    return None
+
+
+async def _osrm_route_legs(coords: List[Tuple[float, float]]) -> Optional[List[float]]:
+    await acquire("osrm")
+    url = "https://router.project-osrm.org/route/v1/driving/" + ";".join(f"{c[1]},{c[0]}" for c in coords)
+    resp = await _client().get(url, params={"overview": "false"})
+    resp.raise_for_status()
+    data = resp.json()
+    routes = data.get("routes") or []
+    if routes:
+        legs = routes[0].get("legs") or []
+        if len(legs) == len(coords) - 1:
+            return [round(float(leg.get("distance", 0)) / 1000.0, 3) for leg in legs]
+        if len(coords) == 2:
+            return [round(float(routes[0].get("distance", 0)) / 1000.0, 3)]
+    return None
+
+
+async def _yandex_route(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> Optional[float]:
+    legs = await _yandex_route_legs([coord_from, coord_to])
+    return legs[0] if legs else None
+
+
+async def _osrm_route(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> Optional[float]:
+    legs = await _osrm_route_legs([coord_from, coord_to])
+    return legs[0] if legs else None
+
+
+def _provider_name(name: str) -> str:
+    return "yandex" if name in ("yandex_geocoder", "yandex_routing") else name
+
+
+async def _route_uncached(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> Optional[Tuple[float, str]]:
+    # Prefer Yandex Routing, then OSRM
+    calls = []
+    if _config.yandex_maps_api_key:
+        calls.append(("yandex_routing", lambda: _yandex_route(coord_from, coord_to)))
+    calls.append(("osrm", lambda: _osrm_route(coord_from, coord_to)))
+    found = await first_valid(calls, _hedge_delay())
+    if not found:
+        return None
+    distance, name = found
+    return distance, _provider_name(name)
+
+
+# Offline results are placeholders that get replaced by a real route later
+PLACEHOLDER_PROVIDERS = ("haversine", "estimate")
+
+
+def estimate_distance_km(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> float:
+    # Instant, network-free distance: straight line times the learned road detour factor
+    return distance_model.estimate_km(coord_from, coord_to)
+
+
+async def route_with_provider(
+    coord_from: Tuple[float, float], coord_to: Tuple[float, float], use_cache: bool = True
+) -> Tuple[float, str]:
+    # Both endpoints are known locations: answer from the precomputed matrix
+    precomputed = matrix_distance(coord_from, coord_to)
+    if use_cache and precomputed:
+        return precomputed
+    cached = await lookup_route(coord_from, coord_to)
+    # Without use_cache the cached route is only kept as a fallback if providers fail
+    if use_cache and cached and cached[1] not in PLACEHOLDER_PROVIDERS:
+        return cached
+    found = await _route_uncached(coord_from, coord_to)
+    if found:
+        distance_model.observe(coord_from, coord_to, found[0])
+        await store_route(coord_from, coord_to, found[0], found[1])
+        return found
+    if cached:
+        return cached
+    # Calibrated estimate instead of the raw haversine
+    distance = estimate_distance_km(coord_from, coord_to)
+    await store_route(coord_from, coord_to, distance, "estimate")
+    return distance, "estimate"
+
+
+async def route_distance_km(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> float:
+    distance, _ = await route_with_provider(coord_from, coord_to)
+    return distance
+
+
+async def route_legs(coords: List[Tuple[float, float]], use_cache: bool = True) -> Tuple[List[float], str]:
+    # Per-leg distances for an ordered list of stops, from one multi-waypoint request
+    if len(coords) == 2:
+        distance, provider = await route_with_provider(coords[0], coords[1], use_cache=use_cache)
+        return [distance], provider
+    pairs = list(zip(coords, coords[1:]))
+    cached = await asyncio.gather(*[lookup_route(a, b) for a, b in pairs])
+    if use_cache and all(c and c[1] not in PLACEHOLDER_PROVIDERS for c in cached):
+        providers = {c[1] for c in cached}  # type: ignore
+        return [c[0] for c in cached], providers.pop() if len(providers) == 1 else "mixed"  # type: ignore
+
+    calls = []
+    if _config.yandex_maps_api_key:
+        calls.append(("yandex_routing", lambda: _yandex_route_legs(coords)))
+    calls.append(("osrm", lambda: _osrm_route_legs(coords)))
+    found = await first_valid(calls, _hedge_delay())
+    if found:
+        legs, name = found
+        provider = _provider_name(name)
+        for (a, b), distance in zip(pairs, legs):
+            distance_model.observe(a, b, distance)
+            await store_route(a, b, distance, provider)
+        return legs, provider
+
+    legs = []
+    for (a, b), c in zip(pairs, cached):
+        if c:
+            legs.append(c[0])
+        else:
+            distance = estimate_distance_km(a, b)
+            await store_route(a, b, distance, "estimate")
+            legs.append(distance)
+    return legs, "estimate"
+
+
+async def _yandex_matrix(
+    origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]]
+) -> Optional[List[List[Optional[float]]]]:
+    await acquire("yandex_routing")
+    params = {
+        "apikey": _config.yandex_maps_api_key,
+        "origins": "|".join(f"{c[0]},{c[1]}" for c in origins),
+        "destinations": "|".join(f"{c[0]},{c[1]}" for c in destinations),
+        "mode": "driving",
+    }
+    resp = await _client().get("https://api.routing.yandex.net/v2/distancematrix", params=params)
+    resp.raise_for_status()
+    data = resp.json()
+    rows = data.get("rows") if isinstance(data, dict) else None
+    if not rows or len(rows) != len(origins):
+        return None
+    matrix = []
+    for row in rows:
+        values = []
+        for el in row.get("elements") or []:
+            dist_obj = el.get("distance") if isinstance(el, dict) else None
+            distance_m = dist_obj.get("value") if isinstance(dist_obj, dict) else None
+            ok = el.get("status", "OK") == "OK" if isinstance(el, dict) else False
+            values.append(round(float(distance_m) / 1000.0, 3) if ok and distance_m is not None else None)
+        matrix.append(values)
+    return matrix
+
+
+async def _osrm_matrix(
+    origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]]
+) -> Optional[List[List[Optional[float]]]]:
+    await acquire("osrm")
+    coords = origins + destinations
+    url = "https://router.project-osrm.org/table/v1/driving/" + ";".join(f"{c[1]},{c[0]}" for c in coords)
+    params = {
+        "annotations": "distance",
+        "sources": ";".join(str(i) for i in range(len(origins))),
+        "destinations": ";".join(str(len(origins) + i) for i in range(len(destinations))),
+    }
+    resp = await _client().get(url, params=params)
+    resp.raise_for_status()
+    data = resp.json()
+    distances = data.get("distances")
+    if not distances or len(distances) != len(origins):
+        return None
+    return [[round(float(d) / 1000.0, 3) if d is not None else None for d in row] for row in distances]
+
+
+async def distance_matrix(
+    origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]]
+) -> Optional[Tuple[List[List[Optional[float]]], str]]:
+    # One table request for origins x destinations; None entries are unreachable pairs
+    calls = []
+    if _config.yandex_maps_api_key:
+        calls.append(("yandex_routing", lambda: _yandex_matrix(origins, destinations)))
+    calls.append(("osrm", lambda: _osrm_matrix(origins, destinations)))
+    found = await first_valid(calls, _hedge_delay())
+    if not found:
+        return None
+    matrix, name = found
+    return matrix, _provider_name(name)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from . import db_writer
+from .cache import TTLCache
+from .config import load_config
+from .db import SessionLocal, GeocodeCacheEntry, RouteCacheEntry
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+_memory = TTLCache(maxsize=_config.geocode_cache_size, ttl=_config.geocode_cache_ttl)
+_stats: Dict[str, int] = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+_routes = TTLCache(maxsize=_config.route_cache_size, ttl=_config.route_cache_ttl)
+_route_stats: Dict[str, int] = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+# Common Russian address abbreviations -> canonical form
+_ABBREVIATIONS = {
+    "ул": "улица",
+    "пр": "проспект",
+    "пр-т": "проспект",
+    "просп": "проспект",
+    "пер": "переулок",
+    "ш": "шоссе",
+    "наб": "набережная",
+    "пл": "площадь",
+    "б-р": "бульвар",
+    "бул": "бульвар",
+    "обл": "область",
+    "р-н": "район",
+    "мкр": "микрорайон",
+    "мкрн": "микрорайон",
+    "пос": "поселок",
+    "пгт": "поселок",
+    "дер": "деревня",
+    "к": "корпус",
+    "корп": "корпус",
+    "стр": "строение",
+}
+# Tokens that do not change the meaning of an address ("г. Москва" == "Москва")
+_FILLER = {"г", "город", "д", "дом"}
+
+# Street types, used by the offline gazetteer to match streets regardless of type word order
+STREET_TYPES = {"улица", "проспект", "переулок", "шоссе", "набережная", "площадь", "бульвар", "микрорайон"}
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+(?:[-/][0-9a-zа-я]+)*")
+
+
+def normalize_address(address: str) -> str:
+    s = address.casefold().replace("ё", "е")
+    tokens = []
+    for tok in _TOKEN_RE.findall(s):
+        tok = _ABBREVIATIONS.get(tok, tok)
+        if tok in _FILLER:
+            continue
+        tokens.append(tok)
+    return " ".join(tokens)
+
+
+def _as_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    if ts is None:
+        return None
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+def is_fresh(ts: Optional[datetime], ttl: float) -> bool:
+    ts = _as_utc(ts)
+    if ts is None:
+        return True
+    return (datetime.now(timezone.utc) - ts).total_seconds() <= ttl
+
+
+def _db_get(key: str) -> Optional[Tuple[Tuple[float, float], Optional[str]]]:
+    with SessionLocal() as db:
+        row = db.get(GeocodeCacheEntry, key)
+        if not row:
+            return None
+        if not is_fresh(row.updated_at, _config.geocode_cache_db_ttl):
+            return None
+        return (row.lat, row.lon), row.provider
+
+
+async def _db_put(key: str, address: str, coord: Tuple[float, float], provider: Optional[str]) -> None:
+    async def _job(db) -> None:
+        await db.merge(
+            GeocodeCacheEntry(
+                key=key,
+                address=address,
+                lat=coord[0],
+                lon=coord[1],
+                provider=provider,
+                updated_at=datetime.now(timezone.utc),
+            )
+        )
+
+    await db_writer.write(_job)
+
+
+async def lookup_geocode(address: str) -> Optional[Tuple[Tuple[float, float], Optional[str]]]:
+    key = normalize_address(address)
+    if not key:
+        return None
+    found = _memory.get(key)
+    if found is not None:
+        _stats["memory_hits"] += 1
+        return found
+    try:
+        found = await asyncio.to_thread(_db_get, key)
+    except Exception:
+        logger.exception("geocode cache read failed")
+        found = None
+    if found is not None:
+        _stats["db_hits"] += 1
+        _memory.set(key, found)
+        return found
+    _stats["misses"] += 1
+    return None
+
+
+async def store_geocode(address: str, coord: Tuple[float, float], provider: Optional[str]) -> None:
+    key = normalize_address(address)
+    if not key:
+        return
+    _memory.set(key, (coord, provider))
+    try:
+        await _db_put(key, address, coord, provider)
+    except Exception:
+        logger.exception("geocode cache write failed")
+
+
+def route_key(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> str:
+    p = _config.route_cache_precision
+    a = f"{round(coord_from[0], p):.{p}f},{round(coord_from[1], p):.{p}f}"
+    b = f"{round(coord_to[0], p):.{p}f},{round(coord_to[1], p):.{p}f}"
+    if _config.route_cache_symmetric and b < a:
+        a, b = b, a
+    return f"{a}|{b}"
+
+
+def _db_get_route(key: str) -> Optional[Tuple[float, str]]:
+    with SessionLocal() as db:
+        row = db.get(RouteCacheEntry, key)
+        if not row or not is_fresh(row.updated_at, _config.route_cache_ttl):
+            return None
+        return row.distance_km, row.provider
+
+
+async def _db_put_route(key: str, distance_km: float, provider: str) -> None:
+    async def _job(db) -> None:
+        await db.merge(
+            RouteCacheEntry(
+                key=key,
+                distance_km=distance_km,
+                provider=provider,
+                updated_at=datetime.now(timezone.utc),
+            )
+        )
+
+    await db_writer.write(_job)
+
+
+async def lookup_route(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> Optional[Tuple[float, str]]:
+    key = route_key(coord_from, coord_to)
+    found = _routes.get(key)
+    if found is not None:
+        _route_stats["memory_hits"] += 1
+        return found
+    try:
+        found = await asyncio.to_thread(_db_get_route, key)
+    except Exception:
+        logger.exception("route cache read failed")
+        found = None
+    if found is not None:
+        _route_stats["db_hits"] += 1
+        _routes.set(key, found)
+        return found
+    _route_stats["misses"] += 1
+    return None
+
+
+async def store_route(
+    coord_from: Tuple[float, float], coord_to: Tuple[float, float], distance_km: float, provider: str
+) -> None:
+    key = route_key(coord_from, coord_to)
+    _routes.set(key, (distance_km, provider))
+    try:
+        await _db_put_route(key, distance_km, provider)
+    except Exception:
+        logger.exception("route cache write failed")
+
+
+def _summary(stats: Dict[str, int], size: int) -> Dict[str, float]:
+    hits = stats["memory_hits"] + stats["db_hits"]
+    total = hits + stats["misses"]
+    return {
+        **stats,
+        "memory_size": size,
+        "hit_ratio": round(hits / total, 3) if total else 0.0,
+    }
+
+
+def geocode_cache_stats() -> Dict[str, float]:
+    return _summary(_stats, len(_memory))
+
+
+def route_cache_stats() -> Dict[str, float]:
+    return _summary(_route_stats, len(_routes))
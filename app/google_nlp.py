@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import google.generativeai as genai
 
 from .config import load_config
+from .llm_router import MODELS
 
 
 def _init_genai() -> bool:
@@ -16,10 +17,10 @@ def _init_genai() -> bool:
     return True
 
 
-def _complete_json(prompt: str, user_text: str) -> Optional[Dict[str, Any]]:
+def complete_json(prompt: str, user_text: str) -> Optional[Dict[str, Any]]:
     if not _init_genai():
         return None
-    model = genai.GenerativeModel("gemini-1.5-flash")
+    model = genai.GenerativeModel(MODELS["google"])
     sys = prompt
     content = f"{sys}\n\nТЕКСТ:\n{user_text}"
     resp = model.generate_content(content)
@@ -39,19 +40,27 @@ def _complete_json(prompt: str, user_text: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def extract_step1_fields(text: str) -> Dict[str, Optional[str]]:
+def extract_step1_fields(text: str) -> Dict[str, Any]:
     prompt = (
-        "Верни строго JSON с ключами: car_number, address_from, address_to. "
+        "Верни строго JSON с ключами: car_number, address_from, address_to, stops. "
+        "stops — массив всех адресов маршрута по порядку: начало, промежуточные точки, конец. "
         "Пустые значения делай пустой строкой. Никаких комментариев."
     )
-    data = _complete_json(prompt, text) or {}
+    data = complete_json(prompt, text) or {}
     def _s(k: str) -> Optional[str]:
         v = data.get(k)
         return (v or "").strip() or None
+    raw_stops = data.get("stops")
+    stops: List[str] = [str(x).strip() for x in raw_stops if x and str(x).strip()] if isinstance(raw_stops, list) else []
+    address_from = stops[0] if len(stops) >= 2 else _s("address_from")
+    address_to = stops[-1] if len(stops) >= 2 else _s("address_to")
+    if len(stops) < 2 and address_from and address_to:
+        stops = [address_from, address_to]
     return {
         "car_number": _s("car_number"),
-        "address_from": _s("address_from"),
-        "address_to": _s("address_to"),
+        "address_from": address_from,
+        "address_to": address_to,
+        "stops": stops or None,
     }
 
 
@@ -60,7 +69,7 @@ def extract_step2_fields(text: str) -> Dict[str, Optional[str | float]]:
         "Верни строго JSON: cargo_type (строка), load_amount (число), unload_amount (число). "
         "Числа только как number без единиц. Пустые поля — null."
     )
-    data = _complete_json(prompt, text) or {}
+    data = complete_json(prompt, text) or {}
 
     def _num(x: Any) -> Optional[float]:
         if x is None:
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete
+
+from . import db_writer
+from .cache import TTLCache
+from .config import load_config
+from .db import SessionLocal, LLMCacheEntry
+from .geo_cache import is_fresh
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+# Extraction results keyed by hash(prompt version, model, normalized text).
+# The prompt version is a hash of the system prompt itself, so editing a prompt
+# makes all entries produced by the old one unreachable; they expire by TTL.
+_memory = TTLCache(maxsize=_config.llm_cache_size, ttl=_config.llm_cache_ttl)
+_stats: Dict[str, float] = {"memory_hits": 0, "db_hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _SPACE_RE.sub(" ", text.casefold().replace("ё", "е")).strip(" .!")
+
+
+def prompt_version(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(system_prompt: str, model: str, text: str) -> str:
+    raw = "\x00".join((prompt_version(system_prompt), model, normalize_text(text)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _db_get(key: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        row = db.get(LLMCacheEntry, key)
+        if not row or not is_fresh(row.updated_at, _config.llm_cache_ttl):
+            return None
+        return {"result": json.loads(row.result), "latency": row.latency}
+
+
+async def _db_put(key: str, model: str, result: Dict[str, Any], latency: float) -> None:
+    async def _job(db) -> None:
+        await db.merge(
+            LLMCacheEntry(
+                key=key,
+                model=model,
+                result=json.dumps(result, ensure_ascii=False),
+                latency=latency,
+                updated_at=datetime.now(timezone.utc),
+            )
+        )
+
+    await db_writer.write(_job)
+
+
+async def lookup(*keys: str) -> Optional[Dict[str, Any]]:
+    # The same request under several keys (one per model): the first entry found wins
+    if _config.llm_cache_size <= 0 or not keys:
+        return None
+    found = next((f for f in map(_memory.get, keys) if f is not None), None)
+    if found is not None:
+        _stats["memory_hits"] += 1
+    else:
+        for key in keys:
+            try:
+                found = await asyncio.to_thread(_db_get, key)
+            except Exception:
+                logger.exception("llm cache read failed")
+                found = None
+            if found is not None:
+                _memory.set(key, found)
+                break
+        if found is None:
+            _stats["misses"] += 1
+            return None
+        _stats["db_hits"] += 1
+    _stats["saved_seconds"] += found["latency"]
+    return found["result"]
+
+
+async def store(key: str, model: str, result: Dict[str, Any], latency: float) -> None:
+    if _config.llm_cache_size <= 0:
+        return
+    _memory.set(key, {"result": result, "latency": latency})
+    try:
+        await _db_put(key, model, result, latency)
+    except Exception:
+        logger.exception("llm cache write failed")
+
+
+async def purge_expired() -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=_config.llm_cache_ttl)
+
+    async def _job(db) -> int:
+        res = await db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.updated_at < cutoff))
+        return res.rowcount or 0
+
+    return await db_writer.write(_job)
+
+
+def llm_cache_stats() -> Dict[str, float]:
+    hits = _stats["memory_hits"] + _stats["db_hits"]
+    total = hits + _stats["misses"]
+    return {
+        **_stats,
+        "saved_seconds": round(_stats["saved_seconds"], 3),
+        "memory_size": len(_memory),
+        "hit_ratio": round(hits / total, 3) if total else 0.0,
+    }
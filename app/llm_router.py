@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import load_config
+from .resilience import breaker, first_valid
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+# Routes JSON completions between the LLM backends: the fastest healthy one first,
+# the others as fallbacks (or hedges). Latency and errors are tracked over a rolling window.
+
+_WINDOW = 50
+_MIN_SAMPLES = 5
+_MAX_ERROR_RATE = 0.5
+_EXPLORE_EVERY = 20  # every n-th call goes to the runner-up so its latency stays current
+
+
+async def _openai(system_prompt: str, user_text: str) -> Optional[Dict[str, Any]]:
+    from .openai_gpt import chat_json
+
+    return await chat_json(system_prompt, user_text)
+
+
+async def _google(system_prompt: str, user_text: str) -> Optional[Dict[str, Any]]:
+    from .google_nlp import complete_json
+
+    # The Gemini SDK is synchronous
+    return await asyncio.to_thread(complete_json, system_prompt, user_text)
+
+
+def _google_available() -> bool:
+    if not _config.google_genai_api_key:
+        return False
+    try:
+        from . import google_nlp  # noqa: F401
+    except ImportError:
+        logger.warning("google llm backend configured but google-generativeai is not installed")
+        return False
+    return True
+
+
+# The model behind each backend; cached answers are keyed by the model that gave them
+MODELS: Dict[str, str] = {
+    "openai": "gpt-4o-mini",
+    "google": "gemini-1.5-flash",
+}
+
+_BACKENDS: Dict[str, Callable[[str, str], Awaitable[Optional[Dict[str, Any]]]]] = {
+    "openai": _openai,
+    "google": _google,
+}
+_AVAILABLE: Dict[str, Callable[[], bool]] = {
+    "openai": lambda: bool(_config.openai_api_key),
+    "google": _google_available,
+}
+
+_latencies: Dict[str, Deque[float]] = {}
+_outcomes: Dict[str, Deque[bool]] = {}
+_stats: Dict[str, Dict[str, float]] = {}
+_providers: Optional[List[str]] = None
+_calls = 0
+
+
+def _enabled() -> List[str]:
+    global _providers
+    if _providers is None:
+        _providers = [p for p in _config.llm_providers if p in _BACKENDS and _AVAILABLE[p]()]
+    return _providers
+
+
+def _record(name: str, latency: Optional[float]) -> None:
+    # latency None: the call failed
+    ok = latency is not None
+    _outcomes.setdefault(name, deque(maxlen=_WINDOW)).append(ok)
+    st = _stats.setdefault(name, {"calls": 0, "errors": 0, "wins": 0})
+    st["calls"] += 1
+    if ok:
+        _latencies.setdefault(name, deque(maxlen=_WINDOW)).append(latency)  # type: ignore[arg-type]
+    else:
+        st["errors"] += 1
+
+
+def _error_rate(name: str) -> float:
+    outcomes = _outcomes.get(name)
+    if not outcomes:
+        return 0.0
+    return 1.0 - sum(outcomes) / len(outcomes)
+
+
+def _percentile(name: str, q: float) -> Optional[float]:
+    samples = _latencies.get(name)
+    if not samples or len(samples) < _MIN_SAMPLES:
+        return None
+    return float(np.percentile(np.fromiter(samples, dtype=float), q))
+
+
+def _healthy(name: str) -> bool:
+    # Read-only: ranking must not move a breaker to half-open for a backend it never calls
+    return breaker(name).closed and _error_rate(name) <= _MAX_ERROR_RATE
+
+
+def _order() -> List[str]:
+    # A backend without enough samples ranks first until it has some
+    return sorted(_enabled(), key=lambda name: (0 if _healthy(name) else 1, _percentile(name, 50) or 0.0))
+
+
+def _ranked() -> List[str]:
+    global _calls
+    _calls += 1
+    ranked = _order()
+    # Exploration only ever promotes a healthy runner-up
+    if len(ranked) > 1 and _calls % _EXPLORE_EVERY == 0 and _healthy(ranked[1]):
+        ranked[0], ranked[1] = ranked[1], ranked[0]
+    return ranked
+
+
+def model_id(name: str) -> str:
+    return f"{name}/{MODELS[name]}"
+
+
+def models() -> List[str]:
+    # Models of the enabled backends, preferred first; for cache lookups, counts no call
+    return [model_id(name) for name in _order()]
+
+
+def _hedge_delay(primary: str) -> Optional[float]:
+    if not _config.llm_hedge:
+        return None
+    p95 = _percentile(primary, 95)
+    return max(_config.llm_hedge_min_delay, p95) if p95 is not None else _config.openai_timeout / 2
+
+
+def _timed(name: str, system_prompt: str, user_text: str) -> Callable[[], Awaitable[Any]]:
+    async def _call() -> Any:
+        started = time.monotonic()
+        try:
+            result = await _BACKENDS[name](system_prompt, user_text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _record(name, None)
+            raise
+        latency = time.monotonic() - started
+        _record(name, latency if result else None)
+        logger.debug("llm %s: %.2fs%s", name, latency, "" if result else " (empty)")
+        return result or None
+
+    return _call
+
+
+async def complete_json(system_prompt: str, user_text: str) -> Optional[Tuple[Dict[str, Any], str]]:
+    ranked = _ranked()
+    if not ranked:
+        return None
+    started = time.monotonic()
+    found = await first_valid(
+        [(name, _timed(name, system_prompt, user_text)) for name in ranked],
+        hedge_delay=_hedge_delay(ranked[0]),
+    )
+    if found is None:
+        logger.warning("llm: no backend answered (%s)", ", ".join(ranked))
+        return None
+    result, name = found
+    _stats[name]["wins"] += 1
+    logger.info("llm: %s answered in %.2fs (ranked %s)", name, time.monotonic() - started, ", ".join(ranked))
+    return result, name
+
+
+def llm_router_stats() -> Dict[str, Dict[str, float]]:
+    result: Dict[str, Dict[str, float]] = {}
+    for name in _enabled():
+        st = _stats.get(name, {"calls": 0, "errors": 0, "wins": 0})
+        result[name] = {
+            **st,
+            "error_rate": round(_error_rate(name), 3),
+            "p50": round(_percentile(name, 50) or 0.0, 3),
+            "p95": round(_percentile(name, 95) or 0.0, 3),
+        }
+    return result
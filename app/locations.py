@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from . import db_writer
+from .config import load_config
+from .db import init_db, SessionLocal, KnownLocation, DistanceMatrixEntry
+from .geo_cache import normalize_address
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+# In-memory registry, reloaded from the database by load_registry()
+_by_alias: Dict[str, int] = {}
+_by_coord: Dict[Tuple[float, float], int] = {}
+_coords: Dict[int, Tuple[float, float]] = {}
+_matrix: Dict[Tuple[int, int], Tuple[float, str]] = {}
+
+
+def _aliases(loc: KnownLocation) -> List[str]:
+    names = [loc.name] + [a for a in (loc.aliases or "").split("|")]
+    return [k for k in (normalize_address(n) for n in names if n.strip()) if k]
+
+
+def load_registry() -> None:
+    global _by_alias, _by_coord, _coords, _matrix
+    by_alias: Dict[str, int] = {}
+    by_coord: Dict[Tuple[float, float], int] = {}
+    coords: Dict[int, Tuple[float, float]] = {}
+    matrix: Dict[Tuple[int, int], Tuple[float, str]] = {}
+    with SessionLocal() as db:
+        for loc in db.execute(select(KnownLocation)).scalars():
+            coords[loc.id] = (loc.lat, loc.lon)
+            by_coord[(loc.lat, loc.lon)] = loc.id
+            for key in _aliases(loc):
+                by_alias.setdefault(key, loc.id)
+        for row in db.execute(select(DistanceMatrixEntry)).scalars():
+            matrix[(row.origin_id, row.destination_id)] = (row.distance_km, row.provider)
+    _by_alias, _by_coord, _coords, _matrix = by_alias, by_coord, coords, matrix
+    logger.info("known locations: %d, matrix entries: %d", len(coords), len(matrix))
+
+
+def resolve_known(address: str) -> Optional[Tuple[float, float]]:
+    loc_id = _by_alias.get(normalize_address(address))
+    return _coords.get(loc_id) if loc_id is not None else None
+
+
+def matrix_distance(coord_from: Tuple[float, float], coord_to: Tuple[float, float]) -> Optional[Tuple[float, str]]:
+    a = _by_coord.get((coord_from[0], coord_from[1]))
+    b = _by_coord.get((coord_to[0], coord_to[1]))
+    if a is None or b is None:
+        return None
+    return _matrix.get((a, b))
+
+
+def _endpoints() -> Tuple[List[KnownLocation], List[KnownLocation]]:
+    with SessionLocal() as db:
+        locs = list(db.execute(select(KnownLocation)).scalars())
+    origins = [loc for loc in locs if loc.kind == "quarry"]
+    destinations = [loc for loc in locs if loc.kind == "site"]
+    if not origins or not destinations:
+        return locs, locs
+    return origins, destinations
+
+
+def _stale_pairs(origins: List[KnownLocation], destinations: List[KnownLocation], max_age: float) -> set:
+    now = datetime.now(timezone.utc)
+    fresh = set()
+    with SessionLocal() as db:
+        for row in db.execute(select(DistanceMatrixEntry)).scalars():
+            ts = row.updated_at
+            if ts is not None and ts.tzinfo is None:
+                ts = ts.replace(tzinfo=timezone.utc)
+            if ts is not None and (now - ts).total_seconds() < max_age:
+                fresh.add((row.origin_id, row.destination_id))
+    return {
+        (o.id, d.id) for o in origins for d in destinations if o.id != d.id and (o.id, d.id) not in fresh
+    }
+
+
+async def _save_block(rows: List[Tuple[int, int, float, str]]) -> None:
+    now = datetime.now(timezone.utc)
+
+    async def _job(db) -> None:
+        for origin_id, destination_id, distance, provider in rows:
+            await db.merge(DistanceMatrixEntry(
+                origin_id=origin_id,
+                destination_id=destination_id,
+                distance_km=distance,
+                provider=provider,
+                updated_at=now,
+            ))
+
+    await db_writer.write(_job)
+
+
+async def refresh_matrix(max_age: Optional[float] = None) -> int:
+    # Recompute stale origin x destination pairs with table routing calls, block by block
+    from .geo import distance_matrix
+
+    max_age = _config.matrix_refresh_interval if max_age is None else max_age
+    origins, destinations = await asyncio.to_thread(_endpoints)
+    stale = await asyncio.to_thread(_stale_pairs, origins, destinations, max_age)
+    if not stale:
+        return 0
+    block = max(1, _config.matrix_block_size)
+    updated = 0
+    for i in range(0, len(origins), block):
+        o_block = [o for o in origins[i:i + block] if any((o.id, d.id) in stale for d in destinations)]
+        if not o_block:
+            continue
+        for j in range(0, len(destinations), block):
+            d_block = destinations[j:j + block]
+            if not any((o.id, d.id) in stale for o in o_block for d in d_block):
+                continue
+            found = await distance_matrix([(o.lat, o.lon) for o in o_block], [(d.lat, d.lon) for d in d_block])
+            if not found:
+                logger.warning("distance matrix block failed, will retry on next refresh")
+                continue
+            matrix, provider = found
+            rows = []
+            for oi, o in enumerate(o_block):
+                for di, d in enumerate(d_block):
+                    distance = matrix[oi][di] if di < len(matrix[oi]) else None
+                    if (o.id, d.id) in stale and distance is not None:
+                        rows.append((o.id, d.id, distance, provider))
+            await _save_block(rows)
+            updated += len(rows)
+    await asyncio.to_thread(load_registry)
+    return updated
+
+
+async def matrix_refresher() -> None:
+    while True:
+        try:
+            updated = await refresh_matrix()
+            if updated:
+                logger.info("distance matrix: %d pairs refreshed", updated)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("distance matrix refresh failed")
+        await asyncio.sleep(_config.matrix_refresh_interval)
+
+
+async def import_csv(path: str) -> int:
+    # Columns: name, kind, lat, lon, aliases ("|"-separated); empty lat/lon are geocoded by name
+    from .geo import geocode_address
+
+    count = 0
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        name = (row.get("name") or "").strip()
+        if not name:
+            continue
+        try:
+            coord: Optional[Tuple[float, float]] = (float(row["lat"]), float(row["lon"]))
+        except (KeyError, TypeError, ValueError):
+            coord = await geocode_address(name)
+        if not coord:
+            logger.warning("skip %r: not geocoded", name)
+            continue
+        with SessionLocal() as db:
+            loc = db.execute(select(KnownLocation).where(KnownLocation.name == name)).scalars().first()
+            if loc is None:
+                loc = KnownLocation(name=name)
+                db.add(loc)
+            loc.kind = (row.get("kind") or "").strip() or None
+            loc.aliases = (row.get("aliases") or "").strip() or None
+            loc.lat, loc.lon = coord
+            db.commit()
+        count += 1
+    return count
+
+
+async def _cli(args: argparse.Namespace) -> None:
+    from .geo import close_http_client
+
+    try:
+        if args.command == "import":
+            print(f"Импортировано точек: {await import_csv(args.path)}")
+        elif args.command == "refresh":
+            print(f"Обновлено пар в матрице: {await refresh_matrix(0.0 if args.all else None)}")
+    finally:
+        await close_http_client()
+        await db_writer.close_db_writer()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser(prog="python -m app.locations", description="Справочник известных точек и матрица расстояний")
+    sub = p.add_subparsers(dest="command", required=True)
+    p_import = sub.add_parser("import", help="загрузить точки из CSV (name,kind,lat,lon,aliases)")
+    p_import.add_argument("path")
+    p_refresh = sub.add_parser("refresh", help="пересчитать устаревшие пары матрицы")
+    p_refresh.add_argument("--all", action="store_true", help="пересчитать все пары")
+    args = p.parse_args()
+    init_db()
+    asyncio.run(_cli(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,37 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
-from typing import Optional
+import signal
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
 
 from aiogram import Bot, Dispatcher, F
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from aiogram.filters import CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.enums import ChatAction
+from aiogram.methods import TelegramMethod
+from sqlalchemy import desc, insert, select
 
 from .config import load_config
-from .db import init_db, SessionLocal, Order
-from .geo import geocode_address, route_distance_km
-from .openai_stt import whisper_stt_ogg_opus
-from .openai_gpt import extract_step1_fields, extract_step2_fields
+from .db import init_db, close_db, AsyncSessionLocal, Order, OrderLeg
+from . import address_book, db_writer, distance_model, fast_parse, fsm_storage, llm_cache, locations, metrics, order_sweeper
+from .geo import (
+    geocode_many,
+    geocode_with_provider,
+    route_distance_km,
+    route_legs,
+    estimate_distance_km,
+    close_http_client,
+)
+from .openai_client import close_openai_client
+from .openai_gpt import extract_order_fields, extract_step2_fields
+from .voice import close_stt_pool, transcribe_voice
 
 
 logger = logging.getLogger(__name__)
@@ -26,6 +42,7 @@ class AddOrderStates(StatesGroup):
     step1_confirm = State()
     step2 = State()  # cargo_type, load_amount, unload_amount
     step2_confirm = State()
+    confirm_all = State()  # every field came in the step-1 message
 
 
 class EditStates(StatesGroup):
@@ -48,6 +65,18 @@ def ok_rewrite_keyboard() -> ReplyKeyboardMarkup:
     )
 
 
+async def step1_keyboard(user_id: int):
+    # Most frequent routes of this user as quick replies
+    book = await address_book.get_book(user_id)
+    if not book.routes:
+        return ReplyKeyboardRemove()
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=address_book.route_label(r))] for r in book.routes[:4]],
+        resize_keyboard=True,
+        one_time_keyboard=True,
+    )
+
+
 async def typing_spinner(bot: Bot, chat_id: int, stop: asyncio.Event) -> None:
     try:
         while not stop.is_set():
@@ -71,18 +100,16 @@ async def handle_add(message: Message, state: FSMContext, bot: Bot):
     await message.answer(
         "Шаг 1. Отправьте одно сообщение (текст/голос), содержащее: \n"
         "- номер машины\n- адрес начала\n- адрес конца\n\n"
-        "Пример: 'Машина А123ВС77, откуда Москва, Тверская 1, куда Москва, Арбат 10'."
+        "Пример: 'Машина А123ВС77, откуда Москва, Тверская 1, куда Москва, Арбат 10'.\n"
+        "Можно сразу добавить груз: '..., ЩПС, загрузка 20, выгрузка 5' — тогда шаг 2 не понадобится.",
+        reply_markup=await step1_keyboard(message.from_user.id if message.from_user else 0),
     )
 
 
 async def _recognize_if_voice(message: Message, bot: Bot) -> Optional[str]:
     if message.voice:
-        file = await bot.get_file(message.voice.file_id)
-        file_path = file.file_path
-        url = f"https://api.telegram.org/file/bot{bot.token}/{file_path}"
-        async with bot.session.get(url) as resp:  # type: ignore
-            audio_bytes = await resp.read()
-        text = whisper_stt_ogg_opus(audio_bytes, language="ru")
+        user_id = message.from_user.id if message.from_user else 0
+        text = await transcribe_voice(bot, message.voice, user_id=user_id, language="ru")
         if not text:
             await message.answer("Не удалось распознать голос. Отправьте текстом, пожалуйста.")
             return None
@@ -102,35 +129,85 @@ async def add_step1(message: Message, state: FSMContext, bot: Bot):
             if not rec:
                 return
             text = rec
-        fields = extract_step1_fields(text)
+        # Known addresses of this user skip the LLM and the geocoder
+        book = await address_book.get_book(message.from_user.id if message.from_user else 0)
+        route_text, has_cargo = fast_parse.split_cargo(text)
+        known = book.resolve_step1(route_text)
+        # Geocoding of a known route overlaps the extraction of the cargo fields
+        geocoding = asyncio.create_task(address_book.geocode_stops(book, known["stops"])) if known else None
+        if known and not has_cargo:
+            fields = known
+        else:
+            fields = await extract_order_fields(text)
+            if known:
+                fields.update(address_from=known["address_from"], address_to=known["address_to"], stops=known["stops"])
+                fields["car_number"] = fields.get("car_number") or known["car_number"]
         car_number = fields.get("car_number")
         addr_from = fields.get("address_from")
         addr_to = fields.get("address_to")
 
         if not (addr_from and addr_to):
+            if geocoding:
+                geocoding.cancel()
             await tech_msg.edit_text("Не удалось распознать адреса. Отправьте в формате: 'номер; адрес начало; адрес конец'")
             return
 
-        coord_from = geocode_address(addr_from)
-        coord_to = geocode_address(addr_to)
-        if not coord_from or not coord_to:
+        stops = fields.get("stops") or [addr_from, addr_to]
+        found = await geocoding if geocoding else await address_book.geocode_stops(book, stops)
+        if not all(found):
             await tech_msg.edit_text("Не удалось геокодировать адреса. Проверьте написание и повторите.")
             return
-        distance = route_distance_km(coord_from, coord_to)
+        coords = [f[0] for f in found]  # type: ignore
+        (coord_from, from_geocoder), (coord_to, to_geocoder) = found[0], found[-1]  # type: ignore
+        estimate = round(sum(estimate_distance_km(a, b) for a, b in zip(coords, coords[1:])), 3)
+        await tech_msg.edit_text(f"Расстояние ≈ {estimate} км, уточняю маршрут…")
+        legs, _ = await route_legs(coords)
+        distance = round(sum(legs), 3)
+        multi_leg = len(stops) > 2
+        load_amount, unload_amount = fields.get("load_amount"), fields.get("unload_amount")
+        complete = load_amount is not None and unload_amount is not None
 
         await state.update_data(
             car_number=car_number,
             address_from=addr_from,
             address_to=addr_to,
             distance_km=distance,
+            from_lat=coord_from[0],
+            from_lon=coord_from[1],
+            from_geocoder=from_geocoder,
+            to_lat=coord_to[0],
+            to_lon=coord_to[1],
+            to_geocoder=to_geocoder,
+            stops=stops if multi_leg else None,
+            leg_distances=legs if multi_leg else None,
         )
-        await state.set_state(AddOrderStates.step1_confirm)
+        cargo_text = ""
+        if complete:
+            cargo_type = (fields.get("cargo_type") or "").strip() or None
+            remainder = round(float(load_amount) - float(unload_amount), 3)
+            await state.update_data(
+                cargo_type=cargo_type,
+                load_amount=float(load_amount),
+                unload_amount=float(unload_amount),
+                remainder=remainder,
+            )
+            cargo_text = (
+                f"Тип: {cargo_type or '-'}\n"
+                f"Загрузка: {load_amount} | Выгрузка: {unload_amount}\n"
+                f"Остаток: {remainder}\n"
+            )
+        await state.set_state(AddOrderStates.confirm_all if complete else AddOrderStates.step1_confirm)
+        if multi_leg:
+            route_lines = [f"{i + 1}. {stops[i]}" + (f" (+{legs[i - 1]} км)" if i else "") for i in range(len(stops))]
+            route_text = "Маршрут:\n" + "\n".join(route_lines) + "\n"
+        else:
+            route_text = f"Откуда: {addr_from}\nКуда: {addr_to}\n"
         summary = (
             f"Распознано:\n"
             f"Номер: {car_number or '-'}\n"
-            f"Откуда: {addr_from}\n"
-            f"Куда: {addr_to}\n"
-            f"Расстояние: {distance} км\n\nПодтвердить?"
+            f"{route_text}"
+            f"Расстояние: {distance} км\n"
+            f"{cargo_text}\nПодтвердить?"
         )
         await tech_msg.edit_text(summary)
         await message.answer("Выберите: Ок или Переписать", reply_markup=ok_rewrite_keyboard())
@@ -144,22 +221,51 @@ async def add_step1(message: Message, state: FSMContext, bot: Bot):
         stop.set()
 
 
+async def _insert_order(user_id: int, data: dict) -> int:
+    # The draft lives in FSM data; the finished order is written with a single INSERT ... RETURNING
+    values = dict(
+        user_id=user_id,
+        car_number=data.get("car_number"),
+        address_from=data.get("address_from"),
+        address_to=data.get("address_to"),
+        distance_km=data.get("distance_km"),
+        from_lat=data.get("from_lat"),
+        from_lon=data.get("from_lon"),
+        from_geocoder=data.get("from_geocoder"),
+        to_lat=data.get("to_lat"),
+        to_lon=data.get("to_lon"),
+        to_geocoder=data.get("to_geocoder"),
+        geocoded_at=datetime.now(timezone.utc) if data.get("from_lat") is not None else None,
+        cargo_type=data.get("cargo_type"),
+        load_amount=data.get("load_amount"),
+        unload_amount=data.get("unload_amount"),
+        remainder=data.get("remainder"),
+    )
+    stops = data.get("stops") or []
+    leg_distances = data.get("leg_distances") or []
+
+    async def _job(db) -> int:
+        order_id = (await db.execute(insert(Order).values(**values).returning(Order.id))).scalar_one()
+        if len(stops) > 2 and len(leg_distances) == len(stops) - 1:
+            await db.execute(insert(OrderLeg), [
+                dict(
+                    order_id=order_id,
+                    seq=i,
+                    address_from=stops[i],
+                    address_to=stops[i + 1],
+                    distance_km=distance,
+                )
+                for i, distance in enumerate(leg_distances)
+            ])
+        return order_id
+
+    return await db_writer.write(_job)
+
+
 async def add_step1_confirm(message: Message, state: FSMContext):
     answer = (message.text or "").strip().casefold()
     if answer == "ок":
-        data = await state.get_data()
-        with SessionLocal() as db:
-            order = Order(
-                user_id=message.from_user.id if message.from_user else 0,
-                car_number=data.get("car_number"),
-                address_from=data.get("address_from"),
-                address_to=data.get("address_to"),
-                distance_km=data.get("distance_km"),
-            )
-            db.add(order)
-            db.commit()
-            db.refresh(order)
-            await state.update_data(order_id=order.id)
+        # Nothing is written yet: the order is saved once step 2 is confirmed
         await state.set_state(AddOrderStates.step2)
         await message.answer(
             "Шаг 2. Отправьте одно сообщение (текст/голос) с: тип груза, загрузка, выгрузка.\n"
@@ -170,7 +276,26 @@ async def add_step1_confirm(message: Message, state: FSMContext):
         await state.set_state(AddOrderStates.step1)
         await message.answer(
             "Ок, отправьте заново Шаг 1: номер машины, адрес начала и адрес конца.",
-            reply_markup=ReplyKeyboardRemove(),
+            reply_markup=await step1_keyboard(message.from_user.id if message.from_user else 0),
+        )
+    else:
+        await message.answer("Пожалуйста, выберите: Ок или Переписать", reply_markup=ok_rewrite_keyboard())
+
+
+async def add_confirm_all(message: Message, state: FSMContext):
+    answer = (message.text or "").strip().casefold()
+    if answer == "ок":
+        user_id = message.from_user.id if message.from_user else 0
+        order_id = await _insert_order(user_id, await state.get_data())
+        address_book.invalidate(user_id)
+        await message.answer(f"Заказ #{order_id} сохранен.", reply_markup=main_keyboard())
+        await state.clear()
+    elif answer == "переписать":
+        await state.clear()
+        await state.set_state(AddOrderStates.step1)
+        await message.answer(
+            "Ок, отправьте заново: номер машины, адрес начала, адрес конца и, если нужно, груз.",
+            reply_markup=await step1_keyboard(message.from_user.id if message.from_user else 0),
         )
     else:
         await message.answer("Пожалуйста, выберите: Ок или Переписать", reply_markup=ok_rewrite_keyboard())
@@ -189,7 +314,7 @@ async def add_step2(message: Message, state: FSMContext, bot: Bot):
                 return
             text = rec
 
-        fields = extract_step2_fields(text)
+        fields = await extract_step2_fields(text)
         cargo_type = (fields.get("cargo_type") or "").strip() or None
         load_amount = fields.get("load_amount")
         unload_amount = fields.get("unload_amount")
@@ -226,23 +351,13 @@ async def add_step2_confirm(message: Message, state: FSMContext):
     answer = (message.text or "").strip().casefold()
     if answer == "ок":
         data = await state.get_data()
-        order_id = data.get("order_id")
-        if not order_id:
+        if not data.get("address_from"):
             await message.answer("Не найден черновик заказа. Начните заново: Добавить.")
             await state.clear()
             return
-        with SessionLocal() as db:
-            order = db.get(Order, int(order_id))
-            if not order:
-                await message.answer("Заказ не найден. Начните заново: Добавить.")
-                await state.clear()
-                return
-            order.cargo_type = data.get("cargo_type")
-            order.load_amount = data.get("load_amount")
-            order.unload_amount = data.get("unload_amount")
-            order.remainder = data.get("remainder")
-            db.add(order)
-            db.commit()
+        user_id = message.from_user.id if message.from_user else 0
+        order_id = await _insert_order(user_id, data)
+        address_book.invalidate(user_id)
         await message.answer(
             f"Заказ #{order_id} сохранен.", reply_markup=main_keyboard()
         )
@@ -258,19 +373,28 @@ async def add_step2_confirm(message: Message, state: FSMContext):
 
 
 async def handle_view(message: Message):
-    with SessionLocal() as db:
-        from sqlalchemy import select, desc
+    async with AsyncSessionLocal() as db:
         stmt = select(Order).where(Order.user_id == (message.from_user.id if message.from_user else 0)).order_by(desc(Order.id)).limit(10)
-        rows = db.execute(stmt).scalars().all()
+        rows = (await db.execute(stmt)).scalars().all()
+        via: dict = {}
+        if rows:
+            leg_stmt = (
+                select(OrderLeg)
+                .where(OrderLeg.order_id.in_([o.id for o in rows]), OrderLeg.seq > 0)
+                .order_by(OrderLeg.order_id, OrderLeg.seq)
+            )
+            for leg in (await db.execute(leg_stmt)).scalars():
+                via.setdefault(leg.order_id, []).append(leg.address_from)
     if not rows:
         await message.answer("У вас пока нет заказов.")
         return
     lines = []
     for o in rows:
+        via_text = f"Через: {'; '.join(via[o.id])}\n" if o.id in via else ""
         lines.append(
             (
                 f"#{o.id} | {o.car_number or '-'} | {o.cargo_type or '-'}\n"
-                f"От: {o.address_from or '-'}\nДо: {o.address_to or '-'} | {o.distance_km or '-'} км\n"
+                f"От: {o.address_from or '-'}\n{via_text}До: {o.address_to or '-'} | {o.distance_km or '-'} км\n"
                 f"Загр: {o.load_amount or '-'} | Выгр: {o.unload_amount or '-'} | Ост: {o.remainder or '-'}\n"
                 f"—"
             )
@@ -280,10 +404,9 @@ async def handle_view(message: Message):
 
 async def handle_edit(message: Message, state: FSMContext):
     await state.clear()
-    with SessionLocal() as db:
-        from sqlalchemy import select, desc
+    async with AsyncSessionLocal() as db:
         stmt = select(Order).where(Order.user_id == (message.from_user.id if message.from_user else 0)).order_by(desc(Order.id)).limit(10)
-        rows = db.execute(stmt).scalars().all()
+        rows = (await db.execute(stmt)).scalars().all()
     if not rows:
         await message.answer("Нет заказов для редактирования.")
         return
@@ -308,6 +431,52 @@ async def edit_choose_id(message: Message, state: FSMContext):
     )
 
 
+async def _update_coordinates(order: Order, legs: List[OrderLeg], changed_from: bool, changed_to: bool) -> bool:
+    # Re-geocode only the side that changed; the other side reuses stored coordinates
+    regeocode_from = changed_from or order.from_lat is None or order.from_lon is None
+    regeocode_to = changed_to or order.to_lat is None or order.to_lon is None
+
+    async def _none() -> None:
+        return None
+
+    found_from, found_to = await asyncio.gather(
+        geocode_with_provider(order.address_from) if regeocode_from else _none(),
+        geocode_with_provider(order.address_to) if regeocode_to else _none(),
+    )
+    now = datetime.now(timezone.utc)
+    # A failed lookup must not leave the old point attached to the new address text
+    if regeocode_from:
+        (order.from_lat, order.from_lon), order.from_geocoder = found_from or ((None, None), None)
+    if regeocode_to:
+        (order.to_lat, order.to_lon), order.to_geocoder = found_to or ((None, None), None)
+    if found_from or found_to:
+        order.geocoded_at = now
+    failed_from, failed_to = regeocode_from and not found_from, regeocode_to and not found_to
+    if failed_from or failed_to:
+        order.distance_km = None
+        if legs:
+            legs[0].address_from, legs[-1].address_to = order.address_from, order.address_to
+            if failed_from:
+                legs[0].distance_km = None
+            if failed_to:
+                legs[-1].distance_km = None
+        return False
+    coord_from, coord_to = (order.from_lat, order.from_lon), (order.to_lat, order.to_lon)
+    if legs:
+        # Multi-leg trip: keep the intermediate stops, replace the endpoints
+        stops = [order.address_from, *[leg.address_to for leg in legs[:-1]], order.address_to]
+        middle = await geocode_many(stops[1:-1])
+        if all(middle):
+            coords = [coord_from, *[m[0] for m in middle], coord_to]  # type: ignore
+            distances, _ = await route_legs(coords)
+            for leg, a, b, distance in zip(legs, stops, stops[1:], distances):
+                leg.address_from, leg.address_to, leg.distance_km = a, b, distance
+            order.distance_km = round(sum(distances), 3)
+            return True
+    order.distance_km = await route_distance_km(coord_from, coord_to)
+    return True
+
+
 def _parse_updates(raw: str) -> dict:
     parts = [p.strip() for p in raw.split(";") if p.strip()]
     data = {}
@@ -340,48 +509,146 @@ async def edit_update_fields(message: Message, state: FSMContext):
         except Exception:
             return None
 
-    changed_distance = False
+    changed_from = False
+    changed_to = False
+
+    async with AsyncSessionLocal() as db:
+        order = await db.get(Order, int(order_id))
+        legs: List[OrderLeg] = []
+        if order:
+            legs = list((await db.execute(
+                select(OrderLeg).where(OrderLeg.order_id == order.id).order_by(OrderLeg.seq)
+            )).scalars())
+    if not order:
+        await message.answer("Заказ не найден.")
+        await state.clear()
+        return
 
-    with SessionLocal() as db:
-        order = db.get(Order, int(order_id))
-        if not order:
-            await message.answer("Заказ не найден.")
-            await state.clear()
-            return
-        if "car" in updates:
-            order.car_number = updates["car"]
-        if "cargo" in updates:
-            order.cargo_type = updates["cargo"]
-        if "from" in updates:
-            order.address_from = updates["from"]
-            changed_distance = True
-        if "to" in updates:
-            order.address_to = updates["to"]
-            changed_distance = True
-        if "load" in updates:
-            order.load_amount = _num(updates["load"]) or order.load_amount
-        if "unload" in updates:
-            order.unload_amount = _num(updates["unload"]) or order.unload_amount
-        if changed_distance and order.address_from and order.address_to:
-            a = geocode_address(order.address_from)
-            b = geocode_address(order.address_to)
-            if a and b:
-                order.distance_km = route_distance_km(a, b)
-        if (order.load_amount is not None) and (order.unload_amount is not None):
-            order.remainder = round(order.load_amount - order.unload_amount, 3)
+    # The rows are changed detached, so no connection is held while geocoding
+    if "car" in updates:
+        order.car_number = updates["car"]
+    if "cargo" in updates:
+        order.cargo_type = updates["cargo"]
+    if "from" in updates:
+        order.address_from = updates["from"]
+        changed_from = True
+    if "to" in updates:
+        order.address_to = updates["to"]
+        changed_to = True
+    if "load" in updates:
+        order.load_amount = _num(updates["load"]) or order.load_amount
+    if "unload" in updates:
+        order.unload_amount = _num(updates["unload"]) or order.unload_amount
+    located = True
+    if (changed_from or changed_to) and order.address_from and order.address_to:
+        located = await _update_coordinates(order, legs, changed_from, changed_to)
+    if (order.load_amount is not None) and (order.unload_amount is not None):
+        order.remainder = round(order.load_amount - order.unload_amount, 3)
+
+    async def _job(db) -> None:
         db.add(order)
-        db.commit()
+        db.add_all(legs)
 
-    await message.answer("Изменения сохранены.", reply_markup=main_keyboard())
+    await db_writer.write(_job)
+    address_book.invalidate(order.user_id)
+
+    if located:
+        await message.answer("Изменения сохранены.", reply_markup=main_keyboard())
+    else:
+        await message.answer(
+            "Изменения сохранены, но адрес не найден на карте: расстояние не рассчитано.",
+            reply_markup=main_keyboard(),
+        )
     await state.clear()
 
 
+class _DrainingRequestHandler(SimpleRequestHandler):
+    # Updates are acknowledged at once and handled in background tasks that we track
+    # ourselves (not through aiogram's internal task set); on shutdown those tasks are
+    # awaited before the bot session is closed
+    def __init__(self, *args, drain_timeout: float, **kwargs) -> None:
+        super().__init__(*args, handle_in_background=False, **kwargs)
+        self.drain_timeout = drain_timeout
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _feed(self, bot: Bot, update: Dict[str, Any]) -> None:
+        result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        if isinstance(result, TelegramMethod):
+            await self.dispatcher.silent_call_request(bot=bot, result=result)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        task = asyncio.create_task(self._feed(bot, await request.json(loads=bot.session.json_loads)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def close(self) -> None:
+        pending = set(self._tasks)
+        if pending:
+            logger.info("draining %d in-flight updates", len(pending))
+            _, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+            for task in not_done:
+                task.cancel()
+            if not_done:
+                logger.warning("%d updates cancelled after %.0f s", len(not_done), self.drain_timeout)
+        await super().close()
+
+
+async def _run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    config = load_config()
+    if not config.webhook_url or not config.webhook_secret:
+        raise RuntimeError("BOT_MODE=webhook needs WEBHOOK_URL and WEBHOOK_SECRET")
+    app = web.Application()
+    handler = _DrainingRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.webhook_secret,
+        drain_timeout=config.webhook_drain_timeout,
+    )
+    handler.register(app, path=config.webhook_path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.webhook_host, config.webhook_port)
+    await site.start()
+    await bot.set_webhook(config.webhook_url, secret_token=config.webhook_secret, allowed_updates=["message"])
+    logger.info("webhook listening on %s:%d%s", config.webhook_host, config.webhook_port, config.webhook_path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stop.wait()
+    finally:
+        # Stops accepting requests, then drains the background updates (see _DrainingRequestHandler)
+        await runner.cleanup()
+
+
 async def run() -> None:
     logging.basicConfig(level=logging.INFO)
     init_db()
-
-    bot = Bot(load_config().telegram_bot_token)
-    dp = Dispatcher()
+    await distance_model.refit()
+    await asyncio.to_thread(locations.load_registry)
+    await llm_cache.purge_expired()
+    await fsm_storage.purge_expired()
+    matrix_task = asyncio.create_task(locations.matrix_refresher())
+    sweeper_task = asyncio.create_task(order_sweeper.run_sweeper())
+    stats_task = asyncio.create_task(metrics.stats_reporter())
+
+    config = load_config()
+    bot = Bot(config.telegram_bot_token)
+    # Drafts survive restarts and are shared by replicas with the SQL storage
+    dp = Dispatcher(storage=fsm_storage.SQLStorage()) if config.fsm_storage == "sql" else Dispatcher()
 
     dp.message.register(handle_start, CommandStart())
     dp.message.register(handle_add, F.text.casefold() == "добавить")
@@ -392,6 +659,7 @@ async def run() -> None:
     dp.message.register(add_step1, StateFilter(AddOrderStates.step1), F.text)
     dp.message.register(add_step1, StateFilter(AddOrderStates.step1), F.voice)
     dp.message.register(add_step1_confirm, StateFilter(AddOrderStates.step1_confirm), F.text)
+    dp.message.register(add_confirm_all, StateFilter(AddOrderStates.confirm_all), F.text)
 
     # Step2: text and voice
     dp.message.register(add_step2, StateFilter(AddOrderStates.step2), F.text)
@@ -401,7 +669,23 @@ async def run() -> None:
     dp.message.register(edit_choose_id, StateFilter(EditStates.choose_id), F.text)
     dp.message.register(edit_update_fields, StateFilter(EditStates.update_fields), F.text)
 
-    await dp.start_polling(bot, allowed_updates=["message"])  # long polling
+    try:
+        if config.bot_mode == "webhook":
+            await _run_webhook(bot, dp)
+        else:
+            await dp.start_polling(bot, allowed_updates=["message"])  # long polling
+    finally:
+        matrix_task.cancel()
+        sweeper_task.cancel()
+        stats_task.cancel()
+        # Neither polling nor the webhook runner closes the FSM storage
+        await dp.storage.close()
+        logger.info("stats %s", json.dumps(metrics.collect(), ensure_ascii=False, sort_keys=True))
+        await close_http_client()
+        await close_stt_pool()
+        await close_openai_client()
+        await db_writer.close_db_writer()
+        await close_db()
 
 
 if __name__ == "__main__":
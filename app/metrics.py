@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict
+
+from . import db_writer, fast_parse, geo_cache, llm_cache, llm_router, ratelimit, voice
+from .config import load_config
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+
+def collect() -> Dict[str, Any]:
+    # Counters of the caches, the fast path, the LLM router, the STT queue and the DB writer
+    return {
+        "geocode_cache": geo_cache.geocode_cache_stats(),
+        "route_cache": geo_cache.route_cache_stats(),
+        "rate_limits": ratelimit.rate_limit_stats(),
+        "fast_path": fast_parse.fast_path_stats(),
+        "llm_cache": llm_cache.llm_cache_stats(),
+        "llm_router": llm_router.llm_router_stats(),
+        "stt": voice.stt_stats(),
+        "db_writer": db_writer.db_writer_stats(),
+    }
+
+
+async def stats_reporter() -> None:
+    if _config.stats_log_interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(_config.stats_log_interval)
+        try:
+            logger.info("stats %s", json.dumps(collect(), ensure_ascii=False, sort_keys=True))
+        except Exception:
+            logger.exception("stats collection failed")
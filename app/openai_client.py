@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from .config import load_config
+
+
+_config = load_config()
+
+_client: Optional[AsyncOpenAI] = None
+
+
+def get_client() -> Optional[AsyncOpenAI]:
+    # One process-wide client: the connection pool keeps TLS sessions to the API alive
+    global _client
+    if not _config.openai_api_key:
+        return None
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(_config.openai_timeout, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=_config.openai_max_connections,
+                max_keepalive_connections=_config.openai_max_connections,
+                keepalive_expiry=60.0,
+            ),
+        )
+        _client = AsyncOpenAI(
+            api_key=_config.openai_api_key,
+            timeout=_config.openai_timeout,
+            max_retries=_config.openai_max_retries,
+            http_client=http_client,
+        )
+    return _client
+
+
+async def close_openai_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -1,55 +1,84 @@
 from __future__ import annotations
 
 import json
-import os
 import re
-from typing import Any, Dict, Optional
-
-from openai import OpenAI
+import time
+from typing import Any, Dict, List, Optional
 
+from . import fast_parse, llm_cache, llm_router
 from .config import load_config
+from .openai_client import get_client
+from .ratelimit import acquire
 
 
-def _client() -> Optional[OpenAI]:
-    cfg = load_config()
-    if not cfg.openai_api_key:
-        return None
-    # Use env var to configure client to avoid kwargs incompatibilities
-    os.environ["OPENAI_API_KEY"] = cfg.openai_api_key
-    return OpenAI()
+_config = load_config()
+
+_MODEL = llm_router.MODELS["openai"]
 
 
-def _complete_json(system_prompt: str, user_text: str) -> Optional[Dict[str, Any]]:
-    client = _client()
+async def chat_json(system_prompt: str, user_text: str) -> Optional[Dict[str, Any]]:
+    # One GPT call; errors propagate so the router can count them
+    client = get_client()
     if not client:
         return None
+    await acquire("openai")
+    resp = await client.chat.completions.create(
+        model=_MODEL,
+        temperature=0,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_text},
+        ],
+        response_format={"type": "json_object"},
+        timeout=_config.openai_timeout,
+    )
+    txt = resp.choices[0].message.content or "{}"
+    return json.loads(txt)
+
+
+async def _complete_json(system_prompt: str, user_text: str) -> Optional[Dict[str, Any]]:
+    # The backend is only known after the call: look under every enabled model's key,
+    # store under the key of the model that actually answered
+    cached = await llm_cache.lookup(*[llm_cache.cache_key(system_prompt, m, user_text) for m in llm_router.models()])
+    if cached is not None:
+        return cached
+    started = time.monotonic()
+    found = await llm_router.complete_json(system_prompt, user_text)
+    if found is None:
+        return None
+    data, provider = found
+    if isinstance(data, dict) and data:
+        model = llm_router.model_id(provider)
+        await llm_cache.store(llm_cache.cache_key(system_prompt, model, user_text), model, data, time.monotonic() - started)
+    return data
+
+
+def _num(x: Any) -> Optional[float]:
+    if x is None:
+        return None
+    if isinstance(x, (int, float)):
+        return float(x)
+    s = str(x).replace(" ", "").replace(",", ".")
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_text},
-            ],
-            response_format={"type": "json_object"},
-            timeout=30,
-        )
-        txt = resp.choices[0].message.content or "{}"
-        return json.loads(txt)
+        return float(s)
     except Exception:
         return None
 
 
-def extract_step1_fields(text: str) -> Dict[str, Optional[str]]:
-    sys = (
-        "Верни строго JSON c ключами: car_number, address_from, address_to. "
-        "Пустые значения делай пустой строкой."
-    )
-    data = _complete_json(sys, text) or {}
+def _clean_stops(raw: Any) -> List[str]:
+    if not isinstance(raw, list):
+        return []
+    return [str(x).strip() for x in raw if x and str(x).strip()]
 
+
+def _step1_from_data(data: Any, text: str) -> Dict[str, Any]:
+    # Route fields from the model's JSON, with regex fallbacks on the original text
     car_number = (data.get("car_number") or "").strip() if isinstance(data, dict) else ""
     address_from = (data.get("address_from") or "").strip() if isinstance(data, dict) else ""
     address_to = (data.get("address_to") or "").strip() if isinstance(data, dict) else ""
+    stops = _clean_stops(data.get("stops")) if isinstance(data, dict) else []
+    if len(stops) >= 2:
+        address_from, address_to = stops[0], stops[-1]
 
     if not address_from or not address_to:
         plate_re = r"([АВЕКМНОРСТУХA-Z]\s?\d{3}\s?[АВЕКМНОРСТУХA-Z]{2}\s?\d{2,3})"
@@ -66,33 +95,33 @@ def extract_step1_fields(text: str) -> Dict[str, Optional[str]]:
             parts = [p.strip() for p in text.split(";") if p.strip()]
             if len(parts) >= 3:
                 car_number = car_number or parts[0]
+                # "номер; откуда; [промежуточные;] куда"
                 address_from = address_from or parts[1]
-                address_to = address_to or parts[2]
+                address_to = address_to or parts[-1]
+                stops = [address_from, *parts[2:-1], address_to]
+
+    if len(stops) < 2 and address_from and address_to:
+        stops = [address_from, address_to]
 
     return {
         "car_number": car_number or None,
         "address_from": address_from or None,
         "address_to": address_to or None,
+        "stops": stops or None,
     }
 
 
-def extract_step2_fields(text: str) -> Dict[str, Optional[str | float]]:
+async def extract_step2_fields(text: str) -> Dict[str, Optional[str | float]]:
+    fields, confidence = fast_parse.parse_step2(text)
+    fast_parse.record("step2", confidence >= _config.fast_path_threshold)
+    if confidence >= _config.fast_path_threshold:
+        return fields
+
     sys = (
         "Верни строго JSON: cargo_type (строка), load_amount (число), unload_amount (число). "
         "Числа — number с точкой, без единиц. Пустые поля — null."
     )
-    data = _complete_json(sys, text) or {}
-
-    def _num(x: Any) -> Optional[float]:
-        if x is None:
-            return None
-        if isinstance(x, (int, float)):
-            return float(x)
-        s = str(x).replace(" ", "").replace(",", ".")
-        try:
-            return float(s)
-        except Exception:
-            return None
+    data = await _complete_json(sys, text) or {}
 
     cargo_type = data.get("cargo_type") if isinstance(data, dict) else None
     load_amount = _num(data.get("load_amount")) if isinstance(data, dict) else None
@@ -113,4 +142,36 @@ def extract_step2_fields(text: str) -> Dict[str, Optional[str | float]]:
         "cargo_type": cargo_type or None,
         "load_amount": load_amount,
         "unload_amount": unload_amount,
-    }
\ No newline at end of file
+    }
+
+
+async def extract_order_fields(text: str) -> Dict[str, Any]:
+    # Route and cargo in one call; the cargo fields stay None when the message has no cargo
+    fields, confidence = fast_parse.parse_order(text)
+    fast_parse.record("order", confidence >= _config.fast_path_threshold)
+    if confidence >= _config.fast_path_threshold:
+        return fields
+
+    sys = (
+        "Верни строго JSON c ключами: car_number, address_from, address_to, stops, "
+        "cargo_type, load_amount, unload_amount. "
+        "stops — массив всех адресов маршрута по порядку: начало, промежуточные точки, конец. "
+        "load_amount и unload_amount — number с точкой, без единиц. "
+        "Чего нет в тексте — null."
+    )
+    data = await _complete_json(sys, text) or {}
+    if not isinstance(data, dict):
+        data = {}
+    route_text, _ = fast_parse.split_cargo(text)
+    result: Dict[str, Any] = {
+        **_step1_from_data(data, route_text),
+        "cargo_type": (str(data.get("cargo_type") or "").strip() or None),
+        "load_amount": _num(data.get("load_amount")),
+        "unload_amount": _num(data.get("unload_amount")),
+    }
+    # Whatever the model missed, take from explicitly labelled fields only;
+    # unlabelled guesses of the rule-based parse are not trusted here
+    for key, value in fast_parse.parse_labelled(text).items():
+        if result.get(key) is None:
+            result[key] = value
+    return result
@@ -1,29 +1,31 @@
 from __future__ import annotations
 
-import os
 from io import BytesIO
-from typing import Optional
-
-from openai import OpenAI
+from typing import BinaryIO, Optional
 
 from .config import load_config
+from .openai_client import get_client
+from .ratelimit import acquire
+
+
+_config = load_config()
 
 
-def whisper_stt_ogg_opus(audio_bytes: bytes, language: str = "ru") -> Optional[str]:
-    cfg = load_config()
-    if not cfg.openai_api_key:
+async def whisper_stt_ogg_opus(audio: bytes | BinaryIO, language: str = "ru") -> Optional[str]:
+    # A file object is streamed into the multipart upload as is
+    client = get_client()
+    if not client:
         return None
-    os.environ["OPENAI_API_KEY"] = cfg.openai_api_key
-    client = OpenAI()
-    file_obj = BytesIO(audio_bytes)
-    file_obj.name = "audio.ogg"
+    file_obj = BytesIO(audio) if isinstance(audio, bytes) else audio
     try:
-        resp = client.audio.transcriptions.create(
+        await acquire("openai")
+        resp = await client.audio.transcriptions.create(
             model="whisper-1",
-            file=file_obj,
+            file=("audio.ogg", file_obj, "audio/ogg"),
             language=language,
             response_format="json",
             temperature=0,
+            timeout=_config.openai_stt_timeout,
         )
         text = getattr(resp, "text", None)
         return text
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select
+
+from . import db_writer
+from .config import load_config
+from .db import ArchivedOrder, Order, OrderLeg
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+_ARCHIVED_COLUMNS = ("id", "created_at", "user_id", "car_number", "address_from", "address_to", "distance_km")
+
+
+def _stale_partial():
+    # Step 1 was saved, step 2 never came: no cargo and no amounts
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=_config.order_sweep_age)
+    return select(Order.id).where(
+        Order.cargo_type.is_(None),
+        Order.load_amount.is_(None),
+        Order.unload_amount.is_(None),
+        Order.created_at < cutoff,
+    )
+
+
+async def sweep_partial_orders() -> int:
+    if _config.order_sweep not in ("archive", "delete"):
+        return 0
+
+    async def _job(db) -> int:
+        ids = list((await db.execute(_stale_partial())).scalars())
+        if not ids:
+            return 0
+        if _config.order_sweep == "archive":
+            await db.execute(insert(ArchivedOrder).from_select(
+                list(_ARCHIVED_COLUMNS),
+                select(*[getattr(Order, c) for c in _ARCHIVED_COLUMNS]).where(Order.id.in_(ids)),
+            ))
+        # SQLite does not enforce ON DELETE CASCADE unless asked to
+        await db.execute(delete(OrderLeg).where(OrderLeg.order_id.in_(ids)))
+        await db.execute(delete(Order).where(Order.id.in_(ids)))
+        return len(ids)
+
+    return await db_writer.write(_job)
+
+
+async def run_sweeper() -> None:
+    while True:
+        try:
+            swept = await sweep_partial_orders()
+            if swept:
+                logger.info("orders: %d abandoned drafts %sd", swept, _config.order_sweep)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("order sweep failed")
+        await asyncio.sleep(_config.order_sweep_interval)
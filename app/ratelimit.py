@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from . import db_writer
+from .config import load_config
+from .db import RateLimitState
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+
+class TokenBucket:
+    # Reservation-style bucket: every caller takes a token immediately (the balance may go
+    # negative) and is told how long to wait, so waiters are served in arrival order.
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1.0
+            return max(0.0, -self.tokens / self.rate)
+
+
+async def _db_reserve(name: str, rate: float, capacity: float) -> float:
+    # Same reservation logic, but the bucket lives in the shared database so that all
+    # replicas draw from one quota. Optimistic concurrency on `version`.
+    async def _job(db) -> Optional[float]:
+        now = time.time()
+        row = await db.get(RateLimitState, name, populate_existing=True)
+        if row is None:
+            db.add(RateLimitState(provider=name, tokens=capacity - 1.0, updated_at=now, version=0))
+            await db.flush()
+            return 0.0
+        elapsed = max(0.0, now - row.updated_at)
+        tokens = min(capacity, row.tokens + elapsed * rate) - 1.0
+        res = await db.execute(
+            update(RateLimitState)
+            .where(RateLimitState.provider == name, RateLimitState.version == row.version)
+            .values(tokens=tokens, updated_at=max(now, row.updated_at), version=row.version + 1)
+        )
+        # None: another replica got there first, try again
+        return max(0.0, -tokens / rate) if res.rowcount == 1 else None
+
+    for _ in range(20):
+        try:
+            wait = await db_writer.write(_job)
+        except IntegrityError:
+            continue
+        if wait is not None:
+            return wait
+    # Heavy contention: fall back to a conservative wait
+    return 1.0 / rate
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _bucket(name: str) -> Optional[TokenBucket]:
+    limit = _config.rate_limits.get(name)
+    if not limit or limit[0] <= 0:
+        return None
+    bucket = _buckets.get(name)
+    if bucket is None:
+        bucket = TokenBucket(limit[0], limit[1])
+        _buckets[name] = bucket
+    return bucket
+
+
+def _record(name: str, wait: float) -> None:
+    st = _stats.setdefault(name, {"calls": 0, "throttled": 0, "wait_seconds": 0.0, "max_wait": 0.0})
+    st["calls"] += 1
+    if wait > 0:
+        st["throttled"] += 1
+        st["wait_seconds"] += wait
+        st["max_wait"] = max(st["max_wait"], wait)
+
+
+async def _reserve(name: str, bucket: TokenBucket) -> float:
+    if not _config.rate_limit_shared:
+        return bucket.reserve()
+    try:
+        return await _db_reserve(name, bucket.rate, bucket.capacity)
+    except Exception:
+        logger.exception("shared rate limiter unavailable, using local bucket")
+        return bucket.reserve()
+
+
+async def acquire(name: str) -> float:
+    bucket = _bucket(name)
+    if bucket is None:
+        return 0.0
+    wait = await _reserve(name, bucket)
+    _record(name, wait)
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return wait
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, float]]:
+    return {name: dict(st) for name, st in _stats.items()}
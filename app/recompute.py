@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import exists, select, update
+
+from .db import init_db, SessionLocal, Order, OrderLeg
+from .geo import PLACEHOLDER_PROVIDERS, geocode_with_provider, route_with_provider, close_http_client
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _resolve_all(
+    keys: Iterable[Hashable], fn: Callable[..., Awaitable[Any]], concurrency: int
+) -> Dict[Hashable, Any]:
+    # Provider throttling is done by ratelimit; the semaphore only bounds in-flight tasks
+    sem = asyncio.Semaphore(concurrency)
+    results: Dict[Hashable, Any] = {}
+
+    async def _one(key: Hashable) -> None:
+        async with sem:
+            try:
+                results[key] = await fn(key)
+            except Exception:
+                logger.exception("failed to resolve %r", key)
+                results[key] = None
+
+    await asyncio.gather(*[_one(k) for k in keys])
+    return results
+
+
+def _load_chunk(
+    after_id: int, limit: int, until_id: Optional[int]
+) -> List[Tuple[int, str, str, Optional[float], Optional[float]]]:
+    with SessionLocal() as db:
+        stmt = (
+            select(Order.id, Order.address_from, Order.address_to, Order.distance_km, Order.from_lat)
+            .where(Order.id > after_id, Order.address_from.is_not(None), Order.address_to.is_not(None))
+            # Multi-leg trips are routed through their stops, not from -> to
+            .where(~exists().where(OrderLeg.order_id == Order.id))
+            .order_by(Order.id)
+            .limit(limit)
+        )
+        if until_id is not None:
+            stmt = stmt.where(Order.id <= until_id)
+        return [tuple(row) for row in db.execute(stmt)]  # type: ignore
+
+
+def _apply_updates(rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    with SessionLocal() as db:
+        # executemany UPDATE ... WHERE id = :id
+        db.execute(update(Order), rows)
+        db.commit()
+
+
+def _read_checkpoint(path: str) -> int:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("last_id", 0))
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_checkpoint(path: str, last_id: int) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"last_id": last_id}, f)
+    os.replace(tmp, path)
+
+
+async def recompute(args: argparse.Namespace) -> Dict[str, int]:
+    use_cache = not args.refresh
+    after_id = args.since_id
+    if args.resume:
+        after_id = max(after_id, _read_checkpoint(args.checkpoint))
+    totals = {"orders": 0, "changed": 0, "unresolved": 0}
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+
+    async def _geocode(address: str):
+        return await geocode_with_provider(address, use_cache=use_cache)
+
+    async def _route(pair):
+        return await route_with_provider(pair[0], pair[1], use_cache=use_cache)
+
+    try:
+        while True:
+            rows = _load_chunk(after_id, args.chunk_size, args.until_id)
+            if not rows:
+                break
+            addresses = {a for _, a_from, a_to, _, _ in rows for a in (a_from, a_to)}
+            coords = await _resolve_all(addresses, _geocode, args.concurrency)
+            pairs = set()
+            for _, a_from, a_to, _, _ in rows:
+                if coords.get(a_from) and coords.get(a_to):
+                    pairs.add((coords[a_from][0], coords[a_to][0]))
+            routes = await _resolve_all(pairs, _route, args.concurrency)
+
+            updates = []
+            now = datetime.now(timezone.utc)
+            for order_id, a_from, a_to, old, stored_lat in rows:
+                totals["orders"] += 1
+                if not (coords.get(a_from) and coords.get(a_to)):
+                    totals["unresolved"] += 1
+                    continue
+                found = routes.get((coords[a_from][0], coords[a_to][0]))
+                if not found or found[1] in PLACEHOLDER_PROVIDERS:
+                    # Routers failed: a modelled estimate must not overwrite the stored distance
+                    totals["unresolved"] += 1
+                    continue
+                new, provider = found
+                (from_coord, from_geocoder), (to_coord, to_geocoder) = coords[a_from], coords[a_to]
+                distance_changed = old is None or abs(new - old) >= args.min_delta
+                if not distance_changed and stored_lat is not None:
+                    continue
+                updates.append({
+                    "id": order_id,
+                    "distance_km": new,
+                    "from_lat": from_coord[0],
+                    "from_lon": from_coord[1],
+                    "from_geocoder": from_geocoder,
+                    "to_lat": to_coord[0],
+                    "to_lon": to_coord[1],
+                    "to_geocoder": to_geocoder,
+                    "geocoded_at": now,
+                })
+                if not distance_changed:
+                    continue
+                totals["changed"] += 1
+                if report or args.dry_run:
+                    delta = "" if old is None else f"{new - old:+.3f}"
+                    line = f"#{order_id}\t{old if old is not None else '-'} -> {new}\t{delta}\t{provider}"
+                    if report:
+                        report.write(line + "\n")
+                    else:
+                        print(line)
+
+            if not args.dry_run:
+                _apply_updates(updates)
+            after_id = rows[-1][0]
+            if not args.dry_run:
+                _write_checkpoint(args.checkpoint, after_id)
+            logger.info("processed up to #%d: %s", after_id, totals)
+    finally:
+        if report:
+            report.close()
+        await close_http_client()
+    return totals
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        prog="python -m app.recompute",
+        description="Пересчёт расстояний (distance_km) для существующих заказов",
+    )
+    p.add_argument("--chunk-size", type=int, default=500)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--since-id", type=int, default=0, help="начать с заказов с id больше указанного")
+    p.add_argument("--until-id", type=int, default=None)
+    p.add_argument("--dry-run", action="store_true", help="ничего не записывать, только показать изменения")
+    p.add_argument("--report", default=None, help="файл для отчёта об изменениях (по умолчанию stdout при --dry-run)")
+    p.add_argument("--refresh", action="store_true", help="игнорировать кэши геокодера и маршрутов")
+    p.add_argument("--min-delta", type=float, default=0.01, help="минимальное изменение, км")
+    p.add_argument("--checkpoint", default="recompute.checkpoint.json")
+    p.add_argument("--resume", action="store_true", help="продолжить с сохранённой контрольной точки")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = _parse_args(argv)
+    init_db()
+    totals = asyncio.run(recompute(args))
+    print(
+        f"Заказов: {totals['orders']}, изменено: {totals['changed']}, "
+        f"не удалось пересчитать: {totals['unresolved']}" + (" (dry-run)" if args.dry_run else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .config import load_config
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive failures and skips the provider for `cooldown` seconds
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 60.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def closed(self) -> bool:
+        return self.opened_at is None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        # Half-open: exactly one trial call; everyone else waits for its outcome
+        self.probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing:
+            # The trial call failed: another full cooldown
+            self.probing = False
+            self.opened_at = time.monotonic()
+            logger.warning("circuit re-opened for %s for %.0f s", self.name, self.cooldown)
+        elif self.failures >= self.failure_threshold and self.opened_at is None:
+            self.opened_at = time.monotonic()
+            logger.warning("circuit opened for %s for %.0f s", self.name, self.cooldown)
+
+    def release(self) -> None:
+        # The trial call was cancelled before it could tell anything: the next caller probes
+        self.probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker(name: str) -> CircuitBreaker:
+    br = _breakers.get(name)
+    if br is None:
+        br = CircuitBreaker(name, _config.breaker_failures, _config.breaker_cooldown)
+        _breakers[name] = br
+    return br
+
+
+ProviderCall = Tuple[str, Callable[[], Awaitable[Any]]]
+
+
+async def _guarded(name: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    # Exceptions count as provider failures; None is a valid "nothing found" answer
+    br = breaker(name)
+    try:
+        result = await factory()
+    except Exception:
+        logger.debug("provider %s failed", name, exc_info=True)
+        br.record_failure()
+        return None
+    br.record_success()
+    return result
+
+
+async def first_valid(calls: List[ProviderCall], hedge_delay: Optional[float] = None) -> Optional[Tuple[Any, str]]:
+    # Providers are tried in order. With hedge_delay set, the next provider is started
+    # when the current one has not answered in time; the first non-None result wins
+    # and the rest are cancelled. Without it the chain is strictly sequential.
+    queue = list(calls)
+    tasks: Dict["asyncio.Task[Any]", str] = {}
+
+    def _launch() -> bool:
+        # The breaker is asked only when a provider is about to be called,
+        # so a half-open provider's single trial is not spent on a call never made
+        while queue:
+            name, factory = queue.pop(0)
+            br = breaker(name)
+            trial = not br.closed
+            if br.allow():
+                task = asyncio.create_task(_guarded(name, factory))
+                if trial:
+                    task.add_done_callback(lambda t, br=br: t.cancelled() and br.release())
+                tasks[task] = name
+                return True
+        return False
+
+    try:
+        while queue or tasks:
+            if not tasks and not _launch():
+                break
+            timeout = hedge_delay if queue else None
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                _launch()
+                continue
+            for task in done:
+                name = tasks.pop(task)
+                result = task.result()
+                if result is not None:
+                    return result, name
+            if queue and tasks:
+                _launch()
+    finally:
+        for task in tasks:
+            task.cancel()
+    return None
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import tempfile
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import Voice
+
+from . import audio
+from .cache import TTLCache
+from .config import load_config
+from .openai_stt import whisper_stt_ogg_opus
+
+
+logger = logging.getLogger(__name__)
+
+_config = load_config()
+
+# file_unique_id is stable across forwards and re-sends of the same voice note
+_transcripts = TTLCache(maxsize=_config.stt_cache_size, ttl=_config.stt_cache_ttl)
+
+
+async def _whisper(audio: BinaryIO, language: str) -> Optional[str]:
+    return await whisper_stt_ogg_opus(audio, language=language)  # type: ignore[arg-type]
+
+
+async def _google(audio: BinaryIO, language: str) -> Optional[str]:
+    from .google_speech import speech_to_text_ogg_opus
+
+    # The Google client is synchronous and takes the whole payload
+    return await asyncio.to_thread(speech_to_text_ogg_opus, audio.read(), f"{language}-{language.upper()}")
+
+
+def _google_available() -> bool:
+    if not _config.gcp_service_account_json:
+        return False
+    try:
+        from . import google_speech  # noqa: F401
+    except ImportError:
+        logger.warning("google stt backend configured but google-cloud-speech is not installed")
+        return False
+    return True
+
+
+_BACKENDS: Dict[str, Callable[[BinaryIO, str], Awaitable[Optional[str]]]] = {
+    "openai": _whisper,
+    "google": _google,
+}
+_AVAILABLE: Dict[str, Callable[[], bool]] = {
+    "openai": lambda: bool(_config.openai_api_key),
+    "google": _google_available,
+}
+
+
+@dataclass
+class _Job:
+    key: str
+    bot: Bot
+    voice: Voice
+    language: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+_backends: List[str] = []
+_in_flight: Dict[str, asyncio.Future] = {}  # file_unique_id -> pending result, for coalescing
+_user_slots: Dict[int, asyncio.Semaphore] = {}
+_user_refs: Dict[int, int] = {}  # notes of the user in flight; the slot is dropped at zero
+_backend_load: Dict[str, int] = {}
+_stats: Dict[str, float] = {
+    "jobs": 0, "coalesced": 0, "cache_hits": 0, "failed": 0,
+    "wait_seconds": 0.0, "max_wait": 0.0, "transcribe_seconds": 0.0,
+}
+
+
+def _start() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _backends[:] = [b for b in _config.stt_backends if b in _BACKENDS and _AVAILABLE[b]()]
+        if not _backends:
+            logger.warning("no stt backend available (STT_BACKENDS=%s)", ",".join(_config.stt_backends))
+        _queue = asyncio.Queue()
+        for i in range(max(1, _config.stt_workers)):
+            _workers.append(asyncio.create_task(_worker(i)))
+    return _queue
+
+
+def _pick_backends() -> List[str]:
+    # Least loaded first; the others are fallbacks if it returns nothing
+    return sorted(_backends, key=lambda b: _backend_load.get(b, 0))
+
+
+async def _transcribe(job: _Job) -> Optional[str]:
+    voice = job.voice
+    # Small notes stay in memory, longer ones spill to a temp file; the upload reads it in chunks
+    with tempfile.SpooledTemporaryFile(max_size=_config.stt_spool_bytes) as buf:
+        started = time.monotonic()
+        await job.bot.download(voice, destination=buf)
+        downloaded = time.monotonic()
+        size = buf.seek(0, 2)
+        if size > _config.stt_max_bytes:
+            logger.warning("voice %s: %d bytes, over the %d limit", voice.file_unique_id, size, _config.stt_max_bytes)
+            return None
+        chunks = None
+        if _config.stt_preprocess:
+            buf.seek(0)
+            chunks = await audio.preprocess(buf)  # type: ignore[arg-type]
+            if chunks == []:
+                logger.info("voice %s: silence only", voice.file_unique_id)
+                return None
+        prepared = time.monotonic()
+        text = None
+        backend = None
+        for backend in _pick_backends():
+            _backend_load[backend] = _backend_load.get(backend, 0) + 1
+            try:
+                if chunks:
+                    # Long clips: chunks are transcribed in parallel and joined in order
+                    parts = await asyncio.gather(*[_BACKENDS[backend](BytesIO(c), job.language) for c in chunks])
+                    text = " ".join(p.strip() for p in parts if p) or None
+                else:
+                    buf.seek(0)
+                    text = await _BACKENDS[backend](buf, job.language)  # type: ignore[arg-type]
+            except Exception:
+                logger.exception("stt backend %s failed", backend)
+            finally:
+                _backend_load[backend] -= 1
+            if text:
+                break
+        finished = time.monotonic()
+
+    _stats["transcribe_seconds"] += finished - downloaded
+    logger.info(
+        "voice %s: %d bytes (%d in memory), download %.2fs, %stranscribe %.2fs via %s",
+        voice.file_unique_id,
+        size,
+        size if size <= _config.stt_spool_bytes else 0,
+        downloaded - started,
+        f"preprocess {prepared - downloaded:.2f}s to {sum(map(len, chunks))} bytes in {len(chunks)} chunks, " if chunks else "",
+        finished - prepared,
+        backend,
+    )
+    return text
+
+
+async def _worker(n: int) -> None:
+    assert _queue is not None
+    while True:
+        job: _Job = await _queue.get()
+        wait = time.monotonic() - job.enqueued_at
+        _stats["wait_seconds"] += wait
+        _stats["max_wait"] = max(_stats["max_wait"], wait)
+        try:
+            text = await _transcribe(job)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception:
+            logger.exception("voice %s: transcription failed", job.key)
+            text = None
+        finally:
+            _queue.task_done()
+        if not text:
+            _stats["failed"] += 1
+        if not job.future.done():
+            job.future.set_result(text)
+
+
+async def transcribe_voice(bot: Bot, voice: Voice, user_id: int = 0, language: str = "ru") -> Optional[str]:
+    key = voice.file_unique_id
+    cached = _transcripts.get(key)
+    if cached is not None:
+        _stats["cache_hits"] += 1
+        return cached
+    if voice.file_size and voice.file_size > _config.stt_max_bytes:
+        logger.warning("voice %s: %d bytes, over the %d limit", key, voice.file_size, _config.stt_max_bytes)
+        return None
+    pending = _in_flight.get(key)
+    if pending is not None:
+        # The same note is already queued (forward, double tap): share its result
+        _stats["coalesced"] += 1
+        return await asyncio.shield(pending)
+
+    queue = _start()
+    future: asyncio.Future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    slots = _user_slots.setdefault(user_id, asyncio.Semaphore(max(1, _config.stt_per_user)))
+    _user_refs[user_id] = _user_refs.get(user_id, 0) + 1
+    try:
+        # Backpressure: a user with too many notes in flight waits for one of them to finish
+        async with slots:
+            _stats["jobs"] += 1
+            queue.put_nowait(_Job(key, bot, voice, language, future))
+            text = await asyncio.shield(future)
+    finally:
+        _in_flight.pop(key, None)
+        _user_refs[user_id] -= 1
+        if not _user_refs[user_id]:
+            del _user_refs[user_id]
+            del _user_slots[user_id]
+        if not future.done():
+            # The caller went away before the result: release the coalesced waiters
+            future.set_result(None)
+    if text:
+        _transcripts.set(key, text)
+    return text
+
+
+def stt_stats() -> Dict[str, float]:
+    jobs = _stats["jobs"]
+    return {
+        **_stats,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "in_flight": len(_in_flight),
+        "users": len(_user_slots),
+        "avg_wait": round(_stats["wait_seconds"] / jobs, 3) if jobs else 0.0,
+        **{f"load_{b}": _backend_load.get(b, 0) for b in _backends},
+    }
+
+
+async def close_stt_pool() -> None:
+    global _queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import tempfile
+
+# app.* reads its configuration at import time: point it at a throwaway database first
+_tmp = tempfile.mkdtemp(prefix="bot-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+for _name in ("OPENAI_API_KEY", "YANDEX_MAPS_API_KEY", "GOOGLE_GENAI_API_KEY", "GAZETTEER_PATH"):
+    os.environ.pop(_name, None)
+
+import pytest  # noqa: E402
+
+from app import db_writer, geo_cache, llm_cache, locations  # noqa: E402
+from app.db import Base, SessionLocal, init_db  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _database():
+    init_db()
+
+
+@pytest.fixture(autouse=True)
+def _clean_state():
+    # Every test starts from empty tables and empty in-process caches
+    with SessionLocal() as db:
+        for table in reversed(Base.metadata.sorted_tables):
+            db.execute(table.delete())
+        db.commit()
+    for cache in (geo_cache._memory, geo_cache._routes, llm_cache._memory):
+        cache.clear()
+    locations.load_registry()
+
+
+@pytest.fixture
+def run():
+    # asyncio.run that also drains the db writer, whose task belongs to the loop being closed
+    def _run(coro):
+        async def _main():
+            try:
+                return await coro
+            finally:
+                await db_writer.close_db_writer()
+
+        return asyncio.run(_main())
+
+    return _run
@@ -0,0 +1,52 @@
+import pytest
+
+from app.address_book import AddressBook, BookEntry
+from app.geo_cache import normalize_address
+
+
+def _book(*addresses, counts=None):
+    book = AddressBook()
+    for i, address in enumerate(addresses):
+        count = counts[i] if counts else 1
+        book.entries[normalize_address(address)] = BookEntry(address, (55.0 + i, 37.0), "yandex_geocoder", count)
+    book.keys = sorted(book.entries)
+    return book
+
+
+def test_exact_and_abbreviated():
+    book = _book("Москва, Арбат 10")
+    assert book.match("г. Москва, Арбат 10").address == "Москва, Арбат 10"
+
+
+def test_prefix_without_number():
+    book = _book("Карьер Лесной", "Москва, Арбат 10")
+    assert book.match("карьер").address == "Карьер Лесной"
+
+
+def test_word_prefixes_with_the_same_number():
+    book = _book("Объект 3, Строительная улица", "Объект 4, Строительная улица")
+    assert book.match("объект 3").address == "Объект 3, Строительная улица"
+
+
+@pytest.mark.parametrize("ref", ["Москва, Арбат 1", "Арбат 12", "Арбат 100", "Москва, Арбат 11"])
+def test_other_house_is_a_miss(ref):
+    book = _book("Москва, Арбат 10")
+    assert book.match(ref) is None
+
+
+def test_typo_with_the_same_number():
+    book = _book("Москва, Тверская 12")
+    assert book.match("Москва, Тверкая 12").address == "Москва, Тверская 12"
+
+
+def test_ambiguous_prefix_is_a_miss():
+    book = _book("Карьер Лесной", "Карьер Южный")
+    assert book.match("карьер") is None
+
+
+def test_resolve_step1_needs_every_stop_known():
+    book = _book("Карьер Лесной", "Москва, Арбат 10")
+    resolved = book.resolve_step1("А123ВС77; карьер; Москва, Арбат 10")
+    assert resolved["car_number"] == "А123ВС77"
+    assert resolved["stops"] == ["Карьер Лесной", "Москва, Арбат 10"]
+    assert book.resolve_step1("карьер; Москва, Арбат 1") is None
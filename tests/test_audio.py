@@ -0,0 +1,64 @@
+import numpy as np
+
+from app import audio
+from app.audio import SAMPLE_RATE, frame_db, speech_bounds, split_points
+
+
+FRAME_S = 0.03
+
+
+def _tone(seconds, amplitude=0.3, freq=440.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def _silence(seconds, amplitude=0.0005, seed=0):
+    noise = np.random.default_rng(seed).normal(0.0, amplitude * 32767, int(seconds * SAMPLE_RATE))
+    return noise.astype(np.int16)
+
+
+def test_frame_levels():
+    db = frame_db(np.concatenate([_silence(0.3), _tone(0.3)]))
+    assert len(db) == 20
+    assert db[:10].max() < -60
+    # A full-scale sine at 0.3 amplitude is about -13.5 dBFS RMS
+    assert np.allclose(db[10:], 20 * np.log10(0.3 / np.sqrt(2)), atol=0.5)
+    assert len(frame_db(np.zeros(100, dtype=np.int16))) == 0
+
+
+def test_silence_around_a_tone_is_trimmed():
+    db = frame_db(np.concatenate([_silence(2.0), _tone(1.0), _silence(3.0)]))
+    start, end = speech_bounds(db)
+    # Speech is frames ~67..100; ~7 frames of padding are kept on each side
+    assert abs(start - (round(2.0 / FRAME_S) - audio._PAD_FRAMES)) <= 1
+    assert abs(end - (round(3.0 / FRAME_S) + audio._PAD_FRAMES)) <= 1
+    assert end - start < len(db) / 2
+
+
+def test_speech_without_silence_is_kept_whole():
+    db = frame_db(_tone(2.0))
+    assert speech_bounds(db) == (0, len(db))
+
+
+def test_silent_clip_has_no_speech():
+    assert speech_bounds(frame_db(_silence(2.0))) is None
+    assert speech_bounds(np.zeros(0)) is None
+
+
+def test_long_clip_is_split_at_pauses():
+    # Speech with 1 s pauses a little before every 60 s boundary
+    clip = np.concatenate([_tone(57.0), _silence(1.0), _tone(57.0), _silence(1.0, seed=1), _tone(30.0)])
+    db = frame_db(clip)
+    max_frames = round(60.0 / FRAME_S)
+    cuts = split_points(db, max_frames)
+    edges = [0, *cuts, len(db)]
+    assert len(cuts) == 2
+    assert all(b - a <= max_frames for a, b in zip(edges, edges[1:]))
+    # Every cut falls inside a pause, not in the middle of a word
+    for cut in cuts:
+        assert db[cut] < -60
+
+
+def test_short_clip_is_not_split():
+    db = frame_db(_tone(10.0))
+    assert split_points(db, round(60.0 / FRAME_S)) == []
@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.db import AsyncSessionLocal, Order, SessionLocal
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite:///data/bot.db", "sqlite+aiosqlite:///data/bot.db"),
+    ("postgresql://bot:pw@db:5432/bot", "postgresql+asyncpg://bot:pw@db:5432/bot"),
+    ("postgresql://bot:pw@db/bot?sslmode=require", "postgresql+asyncpg://bot:pw@db/bot?ssl=require"),
+])
+def test_async_url(url, expected):
+    assert db._async_url(url) == expected
+
+
+def test_async_url_without_a_driver():
+    with pytest.raises(ValueError):
+        db._async_url("mysql://bot@db/bot")
+
+
+def test_async_session_sees_sync_writes_with_sqlite_pragmas(run):
+    with SessionLocal() as session:
+        order = Order(user_id=7, address_from="Карьер", address_to="Стройка")
+        session.add(order)
+        session.commit()
+
+    async def _scenario():
+        async with AsyncSessionLocal() as session:
+            found = await session.get(Order, order.id)
+            journal = (await session.execute(text("PRAGMA journal_mode"))).scalar_one()
+            timeout = (await session.execute(text("PRAGMA busy_timeout"))).scalar_one()
+            return found.address_to, journal, timeout
+
+    address_to, journal, timeout = run(_scenario())
+    assert address_to == "Стройка"
+    assert journal == ("wal" if db._config.sqlite_wal else "delete")
+    assert timeout == int(db._config.sqlite_busy_timeout * 1000)
@@ -0,0 +1,75 @@
+import asyncio
+
+from sqlalchemy import select
+
+from app import db_writer, geo_cache, llm_cache, ratelimit
+from app.db import GeocodeCacheEntry, LLMCacheEntry, RateLimitState, SessionLocal
+
+
+def _put(key):
+    async def _job(db):
+        await db.merge(GeocodeCacheEntry(key=key, address=key, lat=1.0, lon=2.0, provider="test"))
+        return key
+
+    return _job
+
+
+async def _failing(db):
+    # Flushed inside the savepoint, then the job fails: only this row must go away
+    db.add(GeocodeCacheEntry(key="writer-bad", address="bad", lat=0.0, lon=0.0))
+    await db.flush()
+    raise ValueError("boom")
+
+
+def _keys(prefix):
+    with SessionLocal() as db:
+        return set(db.scalars(select(GeocodeCacheEntry.key).where(GeocodeCacheEntry.key.like(prefix + "%"))))
+
+
+def test_concurrent_writes_are_batched(run):
+    before = db_writer.db_writer_stats()
+
+    async def _scenario():
+        return await asyncio.gather(*[db_writer.write(_put(f"writer-batch-{i}")) for i in range(20)])
+
+    assert run(_scenario()) == [f"writer-batch-{i}" for i in range(20)]
+    stats = db_writer.db_writer_stats()
+    assert stats["writes"] - before["writes"] == 20
+    assert stats["batches"] - before["batches"] < 20
+    assert stats["max_batch"] > 1
+    assert _keys("writer-batch-") == {f"writer-batch-{i}" for i in range(20)}
+
+
+def test_failed_write_does_not_undo_the_batch(run):
+    async def _scenario():
+        return await asyncio.gather(
+            db_writer.write(_put("writer-ok-1")),
+            db_writer.write(_failing),
+            db_writer.write(_put("writer-ok-2")),
+            return_exceptions=True,
+        )
+
+    first, failed, second = run(_scenario())
+    assert first == "writer-ok-1" and second == "writer-ok-2"
+    assert isinstance(failed, ValueError)
+    assert _keys("writer-ok-") == {"writer-ok-1", "writer-ok-2"}
+    assert _keys("writer-bad") == set()
+
+
+def test_caches_and_limits_write_through_the_writer(monkeypatch, run):
+    monkeypatch.setattr(ratelimit._config, "rate_limit_shared", True)
+
+    async def _scenario():
+        await geo_cache.store_geocode("Writer street 1", (1.0, 2.0), "test")
+        await llm_cache.store("writer-prompt", "model", {"ok": True}, 0.1)
+        waits = await asyncio.gather(*[ratelimit._db_reserve("writer-test", 1.0, 2.0) for _ in range(3)])
+        return waits, await llm_cache.purge_expired()
+
+    waits, purged = run(_scenario())
+    # Three reservations against a two-token bucket: the third one has to wait
+    assert waits[:2] == [0.0, 0.0] and waits[2] > 0
+    assert purged == 0
+    with SessionLocal() as db:
+        assert db.get(LLMCacheEntry, "writer-prompt") is not None
+        assert db.get(RateLimitState, "writer-test").version == 2
+    assert _keys(geo_cache.normalize_address("Writer street 1")) != set()
@@ -0,0 +1,64 @@
+import asyncio
+
+from app import main
+from app.db import Order, OrderLeg
+
+
+def _order():
+    return Order(
+        user_id=1,
+        address_from="Москва, Тверская 1",
+        address_to="Москва, Арбат 10",
+        distance_km=5.0,
+        from_lat=55.0, from_lon=37.0, from_geocoder="yandex",
+        to_lat=55.1, to_lon=37.1, to_geocoder="yandex",
+    )
+
+
+def test_failed_regeocode_drops_the_old_point(monkeypatch):
+    async def _geocode(address):
+        return None
+
+    monkeypatch.setattr(main, "geocode_with_provider", _geocode)
+    order = _order()
+    order.address_from = "Новый адрес 5"
+
+    assert asyncio.run(main._update_coordinates(order, [], changed_from=True, changed_to=False)) is False
+    assert (order.from_lat, order.from_lon, order.from_geocoder) == (None, None, None)
+    assert order.distance_km is None
+    # The untouched side keeps its coordinates
+    assert (order.to_lat, order.to_lon, order.to_geocoder) == (55.1, 37.1, "yandex")
+
+
+def test_failed_regeocode_updates_the_end_legs(monkeypatch):
+    async def _geocode(address):
+        return None
+
+    monkeypatch.setattr(main, "geocode_with_provider", _geocode)
+    order = _order()
+    order.address_to = "Новый адрес 5"
+    legs = [
+        OrderLeg(seq=0, address_from="Москва, Тверская 1", address_to="Склад", distance_km=2.0),
+        OrderLeg(seq=1, address_from="Склад", address_to="Москва, Арбат 10", distance_km=3.0),
+    ]
+
+    assert asyncio.run(main._update_coordinates(order, legs, changed_from=False, changed_to=True)) is False
+    assert (order.to_lat, order.to_lon, order.to_geocoder) == (None, None, None)
+    assert (legs[0].distance_km, legs[1].address_to, legs[1].distance_km) == (2.0, "Новый адрес 5", None)
+
+
+def test_regeocode_replaces_the_changed_side(monkeypatch):
+    async def _geocode(address):
+        return (56.0, 38.0), "osrm-test"
+
+    async def _route(coord_from, coord_to):
+        return 42.0
+
+    monkeypatch.setattr(main, "geocode_with_provider", _geocode)
+    monkeypatch.setattr(main, "route_distance_km", _route)
+    order = _order()
+    order.address_from = "Новый адрес 5"
+
+    assert asyncio.run(main._update_coordinates(order, [], changed_from=True, changed_to=False)) is True
+    assert (order.from_lat, order.from_lon, order.from_geocoder) == (56.0, 38.0, "osrm-test")
+    assert order.distance_km == 42.0
@@ -0,0 +1,55 @@
+import asyncio
+
+from app import openai_gpt
+
+
+def _extract(monkeypatch, text, llm_answer):
+    async def _complete_json(system_prompt, user_text):
+        return llm_answer
+
+    monkeypatch.setattr(openai_gpt, "_complete_json", _complete_json)
+    return asyncio.run(openai_gpt.extract_order_fields(text))
+
+
+def test_llm_gaps_are_not_filled_with_unlabelled_guesses(monkeypatch):
+    fields = _extract(monkeypatch, "А123ВС77\nзавтра в 9 утра\nМосква, Арбат 10", {
+        "car_number": "А123ВС77",
+        "address_from": None,
+        "address_to": "Москва, Арбат 10",
+    })
+    assert fields["address_from"] is None
+    assert fields["load_amount"] is None and fields["unload_amount"] is None
+
+
+def test_llm_gaps_are_filled_from_labels(monkeypatch):
+    text = "машина А123ВС77 едет с Тверской 1 на Арбат 10, загрузка 20, выгрузка 5"
+    fields = _extract(monkeypatch, text, {
+        "car_number": "А123ВС77",
+        "address_from": "Тверская 1",
+        "address_to": "Арбат 10",
+        "stops": ["Тверская 1", "Арбат 10"],
+        "load_amount": None,
+        "unload_amount": None,
+    })
+    assert (fields["load_amount"], fields["unload_amount"]) == (20.0, 5.0)
+
+
+def test_cargo_after_amounts_is_not_glued_to_the_address(monkeypatch):
+    text = "А123ВС77; Москва, Тверская 1; Москва, Арбат 10, загрузка 20 выгрузка 5 щебень"
+    fields = _extract(monkeypatch, text, {})
+    assert fields["address_to"] == "Москва, Арбат 10"
+    assert (fields["cargo_type"], fields["load_amount"], fields["unload_amount"]) == ("щебень", 20.0, 5.0)
+
+
+def test_unexplained_text_after_amounts_goes_to_the_llm(monkeypatch):
+    text = "А123ВС77; Москва, Тверская 1; Москва, Арбат 10, загрузка 20 выгрузка 5 завтра к 9 утра"
+    fields = _extract(monkeypatch, text, {
+        "car_number": "А123ВС77",
+        "address_from": "Москва, Тверская 1",
+        "address_to": "Москва, Арбат 10",
+        "stops": ["Москва, Тверская 1", "Москва, Арбат 10"],
+        "cargo_type": None,
+        "load_amount": 20,
+        "unload_amount": 5,
+    })
+    assert fields["address_to"] == "Москва, Арбат 10"
@@ -0,0 +1,71 @@
+import pytest
+
+from app.fast_parse import parse_labelled, parse_order, parse_step1, parse_step2, split_cargo
+
+THRESHOLD = 0.8
+
+
+def test_full_order_in_one_message():
+    fields, confidence = parse_order("А123ВС77; Москва, Тверская 1; Москва, Арбат 10; груз: ЩПС; загрузка 20; выгрузка 5")
+    assert confidence >= THRESHOLD
+    assert fields["car_number"] == "А123ВС77"
+    assert fields["stops"] == ["Москва, Тверская 1", "Москва, Арбат 10"]
+    assert (fields["cargo_type"], fields["load_amount"], fields["unload_amount"]) == ("ЩПС", 20.0, 5.0)
+
+
+def test_labelled_fields():
+    fields, confidence = parse_step1("номер: А123ВС77; откуда: Тверская 1; куда: Арбат 10")
+    assert confidence >= THRESHOLD
+    assert (fields["address_from"], fields["address_to"]) == ("Тверская 1", "Арбат 10")
+
+
+@pytest.mark.parametrize("street", ["ул. Загрузочная 5", "Выгрузная улица, 3", "Погрузочный проезд 7"])
+def test_keywords_inside_street_names(street):
+    text = f"А123ВС77; Москва, {street}; Москва, Арбат 10"
+    route_text, has_cargo = split_cargo(text)
+    assert (route_text, has_cargo) == (text, False)
+    fields, _ = parse_order(text)
+    assert fields["load_amount"] is None and fields["unload_amount"] is None
+    assert fields["address_from"] == f"Москва, {street}"
+
+
+def test_street_name_next_to_real_amounts():
+    fields, _ = parse_order("А123ВС77; Москва, ул. Загрузочная 5; Москва, Арбат 10; загрузка 20; выгрузка 15")
+    assert (fields["load_amount"], fields["unload_amount"]) == (20.0, 15.0)
+    assert fields["address_from"] == "Москва, ул. Загрузочная 5"
+
+
+def test_line_with_a_digit_is_not_an_address():
+    fields, confidence = parse_step1("А123ВС77\nзавтра в 9 утра\nМосква, Арбат 10")
+    assert confidence < THRESHOLD
+
+
+def test_step2_forms():
+    assert parse_step2("ЩПС, загрузка 20, выгрузка 5")[0] == {"cargo_type": "ЩПС", "load_amount": 20.0, "unload_amount": 5.0}
+    assert parse_step2("Песок; 20 т; 5 т")[0] == {"cargo_type": "Песок", "load_amount": 20.0, "unload_amount": 5.0}
+    fields, confidence = parse_step2("загрузка 20 т, выгрузка 5 м3")
+    assert confidence < THRESHOLD
+
+
+@pytest.mark.parametrize("cargo", ["щебень", "песок", "гравий"])
+def test_step2_cargo_after_amounts(cargo):
+    fields, confidence = parse_step2(f"загрузка 20, выгрузка 5, {cargo}")
+    assert fields == {"cargo_type": cargo, "load_amount": 20.0, "unload_amount": 5.0}
+    assert confidence >= THRESHOLD
+
+
+def test_step2_unexplained_text_goes_to_llm():
+    fields, confidence = parse_step2("загрузка 20, выгрузка 5, завтра отвезти на базу к вечеру пожалуйста")
+    assert fields["cargo_type"] is None
+    assert confidence < THRESHOLD
+
+
+def test_labelled_only():
+    assert parse_labelled("номер: а123вс77; откуда: Тверская 1; куда: Арбат 10; груз: ЩПС; загрузка 20") == {
+        "car_number": "А123ВС77",
+        "address_from": "Тверская 1",
+        "address_to": "Арбат 10",
+        "cargo_type": "ЩПС",
+        "load_amount": 20.0,
+    }
+    assert parse_labelled("А123ВС77; Москва, ул. Загрузочная 5; Арбат 10; 20; 5") == {}
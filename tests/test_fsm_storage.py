@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+from aiogram.fsm.storage.base import StorageKey
+
+from app import fsm_storage
+from app.db import FSMRecord, SessionLocal
+from app.fsm_storage import SQLStorage
+
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+PK = (1, 100, 100)
+
+
+def _add_expired():
+    stale = datetime.now(timezone.utc) - timedelta(seconds=fsm_storage._config.fsm_ttl + 60)
+    with SessionLocal() as db:
+        db.add(FSMRecord(bot_id=1, chat_id=100, user_id=100, state="Order:address", data='{"car": "old"}', updated_at=stale))
+        db.commit()
+
+
+def test_state_and_data_are_shared_between_instances(run):
+    async def _scenario():
+        writer, reader = SQLStorage(), SQLStorage()
+        await writer.set_state(KEY, "Order:address")
+        await writer.set_data(KEY, {"car": "A123BC"})
+        return await reader.get_state(KEY), await reader.get_data(KEY)
+
+    assert run(_scenario()) == ("Order:address", {"car": "A123BC"})
+
+
+def test_clearing_deletes_the_row(run):
+    async def _scenario():
+        storage = SQLStorage()
+        await storage.set_state(KEY, "Order:address")
+        await storage.set_data(KEY, {"car": "A123BC"})
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        return await SQLStorage().get_state(KEY)
+
+    assert run(_scenario()) is None
+    with SessionLocal() as db:
+        assert db.get(FSMRecord, PK) is None
+
+
+def test_expired_rows_read_as_empty_and_are_purged(run):
+    _add_expired()
+
+    async def _scenario():
+        storage = SQLStorage()
+        return await storage.get_state(KEY), await storage.get_data(KEY), await fsm_storage.purge_expired()
+
+    assert run(_scenario()) == (None, {}, 1)
+    with SessionLocal() as db:
+        assert db.get(FSMRecord, PK) is None
+
+
+def test_expired_draft_is_not_revived_by_a_partial_write(run):
+    _add_expired()
+
+    async def _scenario():
+        await SQLStorage().set_state(KEY, "Order:car")
+        storage = SQLStorage()
+        return await storage.get_state(KEY), await storage.get_data(KEY)
+
+    assert run(_scenario()) == ("Order:car", {})
@@ -0,0 +1,42 @@
+import pytest
+
+from app.gazetteer import Gazetteer, build
+
+
+ROWS = [
+    ("Москва", "Тверская улица", "1", 55.757, 37.613),
+    ("Москва", "Тверская улица", "10", 55.764, 37.605),
+    ("Москва", "улица Арбат", "10", 55.751, 37.596),
+    ("Химки", "улица Ленина", "5", 55.889, 37.444),
+]
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    src = tmp_path / "addresses.csv"
+    src.write_text(
+        "city,street,housenumber,lat,lon\n" + "".join(f"{c},{s},{h},{lat},{lon}\n" for c, s, h, lat, lon in ROWS),
+        encoding="utf-8",
+    )
+    out = tmp_path / "addresses.gaz"
+    build(str(src), str(out))
+    gz = Gazetteer(str(out))
+    yield gz
+    gz.close()
+
+
+def test_exact_house(gazetteer):
+    assert gazetteer.lookup("г. Москва, ул. Тверская, д. 10") == (55.764, 37.605)
+
+
+def test_street_without_city(gazetteer):
+    assert gazetteer.lookup("Тверская 1") == (55.757, 37.613)
+
+
+def test_region_words_do_not_count_as_a_city(gazetteer):
+    assert gazetteer.lookup("Россия, Москва, Арбат 10") == (55.751, 37.596)
+
+
+@pytest.mark.parametrize("address", ["Санкт-Петербург, Тверская 1", "Казань, улица Тверская, 3"])
+def test_street_in_another_city_is_a_miss(gazetteer, address):
+    assert gazetteer.lookup(address) is None
@@ -0,0 +1,43 @@
+import pytest
+
+from app import geo_cache
+from app.geo_cache import normalize_address, route_key
+
+
+@pytest.mark.parametrize("raw", [
+    "г. Москва, ул. Тверская, д. 1",
+    "Москва, улица Тверская, дом 1",
+    "  МОСКВА   ул Тверская 1 ",
+])
+def test_address_spellings_share_a_key(raw):
+    assert normalize_address(raw) == "москва улица тверская 1"
+
+
+def test_normalization_keeps_what_matters():
+    assert normalize_address("Щёлковское ш., 5 к2") == "щелковское шоссе 5 к2"
+    assert normalize_address("Мкр. Северный, корп. 3") == "микрорайон северный корпус 3"
+    assert normalize_address("Тверская 1") != normalize_address("Тверская 10")
+    assert normalize_address("д. 5-7/2") == "5-7/2"
+
+
+def test_route_key_quantizes_nearby_points(monkeypatch):
+    monkeypatch.setattr(geo_cache._config, "route_cache_precision", 3)
+    monkeypatch.setattr(geo_cache._config, "route_cache_symmetric", False)
+    a, b = (55.75581, 37.61731), (59.93863, 30.31413)
+    assert route_key(a, b) == "55.756,37.617|59.939,30.314"
+    assert route_key((55.75579, 37.61729), b) == route_key(a, b)
+    assert route_key((55.7571, 37.6173), b) != route_key(a, b)
+    assert route_key(b, a) != route_key(a, b)
+
+
+def test_symmetric_route_key(monkeypatch):
+    monkeypatch.setattr(geo_cache._config, "route_cache_precision", 3)
+    monkeypatch.setattr(geo_cache._config, "route_cache_symmetric", True)
+    a, b = (59.93863, 30.31413), (55.75581, 37.61731)
+    assert route_key(a, b) == route_key(b, a) == "55.756,37.617|59.939,30.314"
+
+
+def test_geocode_cache_survives_a_restart(run):
+    run(geo_cache.store_geocode("г. Москва, ул. Тверская, д. 1", (55.76, 37.61), "yandex"))
+    geo_cache._memory.clear()
+    assert run(geo_cache.lookup_geocode("москва улица тверская 1")) == ((55.76, 37.61), "yandex")
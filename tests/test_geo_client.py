@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+
+from app import geo
+
+
+PLACES = {"Москва, Тверская 1": ("55.7640", "37.6060"), "Москва, Арбат 10": ("55.7510", "37.5960")}
+
+
+def test_endpoints_are_geocoded_concurrently_over_one_client(monkeypatch, run):
+    in_flight = []
+    peak = []
+
+    async def _handler(request):
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.05)
+        in_flight.pop()
+        lat, lon = PLACES[request.url.params["q"]]
+        return httpx.Response(200, json=[{"lat": lat, "lon": lon}])
+
+    async def _acquire(name):
+        return 0.0
+
+    monkeypatch.setattr(geo, "acquire", _acquire)
+
+    async def _scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+        monkeypatch.setattr(geo, "_http", client)
+        try:
+            first = await geo.geocode_many(list(PLACES))
+            # Cached now: no second round of requests
+            second = await geo.geocode_many(list(PLACES))
+            return first, second, geo._client() is client
+        finally:
+            await geo.close_http_client()
+
+    first, second, reused = run(_scenario())
+    assert first == [((55.764, 37.606), "nominatim"), ((55.751, 37.596), "nominatim")]
+    assert second == first
+    assert reused
+    assert max(peak) == 2 and len(peak) == 2
@@ -0,0 +1,48 @@
+from app import llm_cache, llm_router, openai_gpt
+from app.db import LLMCacheEntry, SessionLocal
+
+
+SYSTEM = "Верни строго JSON c ключами: car_number."
+TEXT = "А123ВС77"
+
+
+def _router(monkeypatch, answers):
+    calls = []
+
+    async def _complete_json(system_prompt, user_text):
+        calls.append(user_text)
+        return answers.pop(0)
+
+    monkeypatch.setattr(llm_router, "_providers", ["openai", "google"])
+    monkeypatch.setattr(llm_router, "complete_json", _complete_json)
+    return calls
+
+
+def test_answer_is_cached_under_the_model_that_gave_it(monkeypatch, run):
+    calls = _router(monkeypatch, [({"car_number": "А123ВС77"}, "google")])
+
+    assert run(openai_gpt._complete_json(SYSTEM, TEXT)) == {"car_number": "А123ВС77"}
+    gemini_key = llm_cache.cache_key(SYSTEM, "google/gemini-1.5-flash", TEXT)
+    with SessionLocal() as db:
+        assert db.get(LLMCacheEntry, gemini_key).model == "google/gemini-1.5-flash"
+        assert db.get(LLMCacheEntry, llm_cache.cache_key(SYSTEM, "openai/gpt-4o-mini", TEXT)) is None
+
+    # Served from the cache on the next call
+    assert run(openai_gpt._complete_json(SYSTEM, TEXT)) == {"car_number": "А123ВС77"}
+    assert len(calls) == 1
+
+
+def test_prompt_change_misses_the_cache(monkeypatch, run):
+    calls = _router(monkeypatch, [({"car_number": "old"}, "openai"), ({"car_number": "new"}, "openai")])
+
+    assert run(openai_gpt._complete_json(SYSTEM, TEXT)) == {"car_number": "old"}
+    assert run(openai_gpt._complete_json(SYSTEM + " Без комментариев.", TEXT)) == {"car_number": "new"}
+    assert len(calls) == 2
+    # Entries of each prompt version stay apart
+    assert run(openai_gpt._complete_json(SYSTEM, TEXT)) == {"car_number": "old"}
+    assert len(calls) == 2
+
+
+def test_key_ignores_case_and_spacing():
+    assert llm_cache.cache_key(SYSTEM, "m", "Москва,  Арбат 10!") == llm_cache.cache_key(SYSTEM, "m", "москва, арбат 10")
+    assert llm_cache.cache_key(SYSTEM, "m", TEXT) != llm_cache.cache_key(SYSTEM, "other", TEXT)
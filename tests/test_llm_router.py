@@ -0,0 +1,33 @@
+from app import llm_router, resilience
+from app.resilience import CircuitBreaker
+
+
+def _setup(monkeypatch, breakers):
+    monkeypatch.setattr(llm_router, "_providers", ["openai", "google"])
+    monkeypatch.setattr(llm_router, "_latencies", {"openai": [1.0] * 10, "google": [2.0] * 10})
+    monkeypatch.setattr(llm_router, "_outcomes", {})
+    monkeypatch.setattr(llm_router, "_calls", 0)
+    for name, br in breakers.items():
+        monkeypatch.setitem(resilience._breakers, name, br)
+
+
+def _open(name):
+    br = CircuitBreaker(name, failure_threshold=1, cooldown=0.0)
+    br.record_failure()
+    return br
+
+
+def test_ranking_does_not_touch_breakers(monkeypatch):
+    google = _open("google")
+    _setup(monkeypatch, {"openai": CircuitBreaker("openai"), "google": google})
+    for _ in range(llm_router._EXPLORE_EVERY * 2):
+        assert llm_router._ranked() == ["openai", "google"]
+    # Cooldown is over, but only a real call may take the trial
+    assert not google.probing and not google.closed
+
+
+def test_exploration_promotes_a_healthy_runner_up(monkeypatch):
+    _setup(monkeypatch, {"openai": CircuitBreaker("openai"), "google": CircuitBreaker("google")})
+    orders = [llm_router._ranked() for _ in range(llm_router._EXPLORE_EVERY)]
+    assert orders[:-1] == [["openai", "google"]] * (llm_router._EXPLORE_EVERY - 1)
+    assert orders[-1] == ["google", "openai"]
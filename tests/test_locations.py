@@ -0,0 +1,64 @@
+from app import geo, locations
+from app.db import KnownLocation, SessionLocal
+
+
+QUARRY = (55.5, 38.0)
+SITE = (55.8, 37.5)
+
+
+def _add_locations():
+    with SessionLocal() as db:
+        quarry = KnownLocation(name="Карьер Северный", kind="quarry", aliases="Северный карьер|КС-1", lat=QUARRY[0], lon=QUARRY[1])
+        site = KnownLocation(name="Стройка на Ленинском", kind="site", lat=SITE[0], lon=SITE[1])
+        db.add_all([quarry, site])
+        db.commit()
+        return quarry.id, site.id
+
+
+async def _no_provider(*args):
+    raise AssertionError("known locations must not reach the providers")
+
+
+def test_known_location_by_name_or_alias(monkeypatch, run):
+    _add_locations()
+    locations.load_registry()
+    monkeypatch.setattr(geo, "_geocode_uncached", _no_provider)
+
+    assert locations.resolve_known("карьер  северный") == QUARRY
+    assert locations.resolve_known("КС-1") == QUARRY
+    assert locations.resolve_known("Карьер Южный") is None
+    assert run(geo.geocode_with_provider("Северный карьер")) == (QUARRY, "known")
+
+
+def test_matrix_hit_skips_routing(monkeypatch, run):
+    quarry_id, site_id = _add_locations()
+    locations.load_registry()
+    requested = []
+
+    async def _distance_matrix(origins, destinations):
+        requested.append((origins, destinations))
+        return [[42.5]], "osrm"
+
+    monkeypatch.setattr(geo, "distance_matrix", _distance_matrix)
+    monkeypatch.setattr(geo, "_route_uncached", _no_provider)
+
+    assert run(locations.refresh_matrix()) == 1
+    assert requested == [([QUARRY], [SITE])]
+    assert locations.matrix_distance(QUARRY, SITE) == (42.5, "osrm")
+    assert run(geo.route_with_provider(QUARRY, SITE)) == (42.5, "osrm")
+    # Fresh pairs are not recomputed
+    assert run(locations.refresh_matrix()) == 0
+    assert len(requested) == 1
+
+
+def test_matrix_miss_falls_back_to_routing(monkeypatch, run):
+    _add_locations()
+    locations.load_registry()
+
+    async def _route_uncached(coord_from, coord_to):
+        return 51.0, "osrm"
+
+    monkeypatch.setattr(geo, "_route_uncached", _route_uncached)
+    # No matrix entry for the reverse direction
+    assert locations.matrix_distance(SITE, QUARRY) is None
+    assert run(geo.route_with_provider(SITE, QUARRY)) == (51.0, "osrm")
@@ -0,0 +1,9 @@
+import json
+
+from app import metrics
+
+
+def test_collect_is_json_serializable():
+    stats = metrics.collect()
+    assert {"geocode_cache", "route_cache", "rate_limits", "fast_path", "llm_cache", "llm_router", "stt", "db_writer"} <= set(stats)
+    json.dumps(stats)
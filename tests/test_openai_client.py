@@ -0,0 +1,23 @@
+from app import openai_client
+
+
+def test_no_client_without_a_key(monkeypatch):
+    monkeypatch.setattr(openai_client._config, "openai_api_key", None)
+    assert openai_client.get_client() is None
+
+
+def test_one_client_per_process(monkeypatch, run):
+    monkeypatch.setattr(openai_client._config, "openai_api_key", "sk-test")
+    monkeypatch.setattr(openai_client, "_client", None)
+
+    async def _scenario():
+        first = openai_client.get_client()
+        same = openai_client.get_client() is first
+        await openai_client.close_openai_client()
+        return first, same, openai_client.get_client()
+
+    first, same, after_close = run(_scenario())
+    assert same
+    # Closing drops the client; the next call builds a fresh one
+    assert after_close is not None and after_close is not first
+    run(openai_client.close_openai_client())
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from app import order_sweeper
+from app.db import ArchivedOrder, Order, OrderLeg, SessionLocal
+from app.main import _insert_order
+
+
+def _add_order(created_at, **fields):
+    with SessionLocal() as db:
+        order = Order(user_id=500, car_number="A123BC", address_from="Карьер", address_to="Стройка", created_at=created_at, **fields)
+        db.add(order)
+        db.flush()
+        db.add(OrderLeg(order_id=order.id, seq=0, address_from="Карьер", address_to="Стройка", distance_km=10.0))
+        db.commit()
+        return order.id
+
+
+def test_insert_order_writes_legs(run):
+    data = {
+        "car_number": "A123BC",
+        "address_from": "Карьер",
+        "address_to": "Стройка",
+        "distance_km": 30.0,
+        "stops": ["Карьер", "Склад", "Стройка"],
+        "leg_distances": [10.0, 20.0],
+        "cargo_type": "песок",
+        "load_amount": 20.0,
+    }
+    order_id = run(_insert_order(501, data))
+    with SessionLocal() as db:
+        order = db.get(Order, order_id)
+        assert (order.user_id, order.cargo_type, order.distance_km) == (501, "песок", 30.0)
+        legs = db.scalars(select(OrderLeg).where(OrderLeg.order_id == order_id).order_by(OrderLeg.seq)).all()
+        assert [(leg.address_from, leg.address_to, leg.distance_km) for leg in legs] == [
+            ("Карьер", "Склад", 10.0),
+            ("Склад", "Стройка", 20.0),
+        ]
+
+
+def test_stale_partial_orders_are_archived(monkeypatch, run):
+    monkeypatch.setattr(order_sweeper._config, "order_sweep", "archive")
+    old = datetime.now(timezone.utc) - timedelta(seconds=order_sweeper._config.order_sweep_age + 60)
+    stale = _add_order(old)
+    finished = _add_order(old, cargo_type="щебень", load_amount=10.0)
+    recent = _add_order(datetime.now(timezone.utc))
+
+    assert run(order_sweeper.sweep_partial_orders()) == 1
+    with SessionLocal() as db:
+        assert db.get(Order, stale) is None
+        assert db.scalars(select(OrderLeg).where(OrderLeg.order_id == stale)).first() is None
+        archived = db.get(ArchivedOrder, stale)
+        assert (archived.user_id, archived.address_from, archived.address_to) == (500, "Карьер", "Стройка")
+        assert db.get(Order, finished) is not None
+        assert db.get(Order, recent) is not None
+
+
+def test_sweep_can_be_disabled(monkeypatch, run):
+    monkeypatch.setattr(order_sweeper._config, "order_sweep", "off")
+    old = datetime.now(timezone.utc) - timedelta(seconds=order_sweeper._config.order_sweep_age + 60)
+    stale = _add_order(old)
+
+    assert run(order_sweeper.sweep_partial_orders()) == 0
+    with SessionLocal() as db:
+        assert db.get(Order, stale) is not None
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+
+from app import db_writer, ratelimit
+from app.db import RateLimitState, SessionLocal
+from app.ratelimit import TokenBucket
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Only the limiter's clock: the event loop keeps the real one
+    clock = _Clock()
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+
+def test_bucket_serves_a_burst_then_spaces_callers(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3.0)
+    assert [bucket.reserve() for _ in range(5)] == [0.0, 0.0, 0.0, 0.5, 1.0]
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3.0)
+    for _ in range(3):
+        bucket.reserve()
+    clock.now += 1.0
+    # Two tokens came back in one second
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.5]
+    clock.now += 60.0
+    # A long pause does not bank more than the capacity
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.0, 0.5]
+
+
+class _RacingSession:
+    # Another replica takes the last token between our read and our update
+    def __init__(self, db, raced):
+        self._db = db
+        self._raced = raced
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    async def get(self, *args, **kwargs):
+        row = await self._db.get(*args, **kwargs)
+        if row is not None and not self._raced:
+            self._raced.append(row.version)
+            await self._db.execute(
+                update(RateLimitState)
+                .where(RateLimitState.provider == row.provider)
+                .values(tokens=0.0, version=RateLimitState.version + 1)
+                .execution_options(synchronize_session=False)
+            )
+        return row
+
+
+def test_shared_bucket_retries_on_a_version_conflict(monkeypatch, clock, run):
+    write = db_writer.write
+    raced = []
+
+    async def _racing_write(job):
+        return await write(lambda db: job(_RacingSession(db, raced)))
+
+    assert run(ratelimit._db_reserve("race-test", 1.0, 5.0)) == 0.0
+    monkeypatch.setattr(db_writer, "write", _racing_write)
+
+    # Our update lost; the retry sees the other replica's spend and has to wait
+    assert run(ratelimit._db_reserve("race-test", 1.0, 5.0)) == 1.0
+    assert raced == [0]
+    with SessionLocal() as db:
+        row = db.get(RateLimitState, "race-test")
+        assert (row.version, row.tokens) == (2, -1.0)
@@ -0,0 +1,45 @@
+from app import recompute
+from app.db import Order, SessionLocal
+
+
+COORDS = {
+    "Карьер": (55.5, 38.0),
+    "Стройка": (55.8, 37.5),
+    "Склад": (55.6, 37.9),
+}
+
+
+def _add_orders():
+    with SessionLocal() as db:
+        routed = Order(user_id=1, address_from="Карьер", address_to="Стройка", distance_km=30.0)
+        offline = Order(user_id=1, address_from="Карьер", address_to="Склад", distance_km=12.0)
+        unknown = Order(user_id=1, address_from="Карьер", address_to="Нигде", distance_km=7.0)
+        db.add_all([routed, offline, unknown])
+        db.commit()
+        return routed.id, offline.id, unknown.id
+
+
+def test_only_real_routes_overwrite_distances(monkeypatch, run, tmp_path):
+    routed_id, offline_id, unknown_id = _add_orders()
+
+    async def _geocode(address, use_cache=True):
+        return (COORDS[address], "yandex") if address in COORDS else None
+
+    async def _route(coord_from, coord_to, use_cache=True):
+        # The router is down for one pair: route_with_provider answers with an estimate
+        if coord_to == COORDS["Склад"]:
+            return 14.0, "estimate"
+        return 42.0, "osrm"
+
+    monkeypatch.setattr(recompute, "geocode_with_provider", _geocode)
+    monkeypatch.setattr(recompute, "route_with_provider", _route)
+    args = recompute._parse_args(["--checkpoint", str(tmp_path / "checkpoint.json")])
+
+    assert run(recompute.recompute(args)) == {"orders": 3, "changed": 1, "unresolved": 2}
+    with SessionLocal() as db:
+        routed = db.get(Order, routed_id)
+        assert (routed.distance_km, routed.from_lat, routed.to_geocoder) == (42.0, 55.5, "yandex")
+        offline = db.get(Order, offline_id)
+        assert (offline.distance_km, offline.from_lat) == (12.0, None)
+        assert db.get(Order, unknown_id).distance_km == 7.0
+    assert recompute._read_checkpoint(args.checkpoint) == unknown_id
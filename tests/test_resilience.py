@@ -0,0 +1,78 @@
+import asyncio
+
+from app import resilience
+from app.resilience import CircuitBreaker, first_valid
+
+
+def _tripped(name="test", cooldown=0.0):
+    br = CircuitBreaker(name, failure_threshold=2, cooldown=cooldown)
+    br.record_failure()
+    br.record_failure()
+    return br
+
+
+def test_open_breaker_rejects_until_cooldown():
+    br = _tripped(cooldown=60.0)
+    assert not br.closed
+    assert not br.allow()
+
+
+def test_half_open_lets_one_trial_through():
+    br = _tripped()
+    assert br.allow()
+    assert [br.allow() for _ in range(5)] == [False] * 5
+    br.record_success()
+    assert br.closed and br.allow()
+
+
+def test_failed_trial_reopens():
+    br = _tripped()
+    assert br.allow()
+    br.record_failure()
+    assert not br.closed and not br.probing
+    # cooldown 0: the next caller gets the next trial
+    assert br.allow()
+
+
+def test_concurrent_callers_send_one_trial(monkeypatch):
+    br = _tripped("trial-provider")
+    monkeypatch.setitem(resilience._breakers, "trial-provider", br)
+    calls = []
+
+    async def _provider():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def _run():
+        return await asyncio.gather(*[first_valid([("trial-provider", _provider)]) for _ in range(5)])
+
+    results = asyncio.run(_run())
+    assert len(calls) == 1
+    assert results.count(("ok", "trial-provider")) == 1
+    assert br.closed
+
+
+def test_cancelled_trial_frees_the_slot(monkeypatch):
+    br = _tripped("slow-provider")
+    monkeypatch.setitem(resilience._breakers, "slow-provider", br)
+    monkeypatch.setitem(resilience._breakers, "fast-provider", CircuitBreaker("fast-provider"))
+
+    started = []
+
+    async def _slow():
+        started.append(1)
+        await asyncio.sleep(1)
+        return "slow"
+
+    async def _fast():
+        return "fast"
+
+    async def _run():
+        found = await first_valid([("slow-provider", _slow), ("fast-provider", _fast)], hedge_delay=0.0)
+        await asyncio.sleep(0)
+        return found
+
+    assert asyncio.run(_run()) == ("fast", "fast-provider")
+    assert started == [1]
+    assert not br.probing and br.allow()
@@ -0,0 +1,44 @@
+from app import geo
+
+
+A = (55.7001, 37.6001)
+B = (55.9001, 37.9001)
+
+
+def test_estimate_is_replaced_by_a_real_route(monkeypatch, run):
+    routes = []
+
+    async def _route_uncached(coord_from, coord_to):
+        return routes.pop(0) if routes else None
+
+    monkeypatch.setattr(geo, "_route_uncached", _route_uncached)
+
+    async def _scenario():
+        offline = await geo.route_with_provider(A, B)
+        # Providers are back: the cached estimate must not be served as a hit
+        routes.append((31.5, "osrm"))
+        online = await geo.route_with_provider(A, B)
+        # Now the real route is cached and no provider call is needed
+        cached = await geo.route_with_provider(A, B)
+        return offline, online, cached, await geo.lookup_route(A, B)
+
+    offline, online, cached, stored = run(_scenario())
+    assert offline[1] == "estimate" and offline[0] > 0
+    assert online == (31.5, "osrm")
+    assert cached == (31.5, "osrm")
+    assert stored == (31.5, "osrm")
+
+
+def test_cached_estimate_is_the_fallback_when_providers_fail(monkeypatch, run):
+    async def _route_uncached(coord_from, coord_to):
+        return None
+
+    monkeypatch.setattr(geo, "_route_uncached", _route_uncached)
+
+    async def _scenario():
+        first = await geo.route_with_provider(B, A)
+        return first, await geo.route_with_provider(B, A)
+
+    first, second = run(_scenario())
+    assert first[1] == "estimate"
+    assert second == first
@@ -0,0 +1,32 @@
+from app import geo
+
+
+STOPS = [(55.61, 37.61), (55.71, 37.71), (55.81, 37.81)]
+
+
+def test_legs_come_from_one_request_and_are_cached(monkeypatch, run):
+    requests = []
+
+    async def _osrm_route_legs(coords):
+        requests.append(coords)
+        return [12.0, 13.5]
+
+    monkeypatch.setattr(geo, "_osrm_route_legs", _osrm_route_legs)
+
+    assert run(geo.route_legs(STOPS)) == ([12.0, 13.5], "osrm")
+    assert requests == [STOPS]
+    # Every leg is cached on its own: the same trip and a single leg need no request
+    assert run(geo.route_legs(STOPS)) == ([12.0, 13.5], "osrm")
+    assert run(geo.route_with_provider(STOPS[1], STOPS[2])) == (13.5, "osrm")
+    assert len(requests) == 1
+
+
+def test_legs_fall_back_to_estimates(monkeypatch, run):
+    async def _osrm_route_legs(coords):
+        return None
+
+    monkeypatch.setattr(geo, "_osrm_route_legs", _osrm_route_legs)
+
+    legs, provider = run(geo.route_legs(STOPS))
+    assert provider == "estimate"
+    assert len(legs) == 2 and all(leg > 0 for leg in legs)
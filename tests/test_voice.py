@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import voice
+
+
+def test_per_user_slots_are_released(monkeypatch):
+    async def _transcribe(job):
+        await asyncio.sleep(0.01)
+        return "text " + job.key
+
+    monkeypatch.setattr(voice, "_transcribe", _transcribe)
+
+    async def _run():
+        try:
+            return await asyncio.gather(*[
+                voice.transcribe_voice(None, SimpleNamespace(file_unique_id=f"note{i}", file_size=10), user_id=i % 3)
+                for i in range(9)
+            ])
+        finally:
+            await voice.close_stt_pool()
+
+    assert asyncio.run(_run()) == [f"text note{i}" for i in range(9)]
+    assert voice._user_slots == {} and voice._user_refs == {}
+
+
+def test_same_note_is_transcribed_once(monkeypatch):
+    calls = []
+
+    async def _transcribe(job):
+        calls.append(job.key)
+        await asyncio.sleep(0.01)
+        return "text"
+
+    monkeypatch.setattr(voice, "_transcribe", _transcribe)
+    note = SimpleNamespace(file_unique_id="same-note", file_size=10)
+
+    async def _run():
+        try:
+            # A double tap while the first request is running, then a repeat from the cache
+            first = await asyncio.gather(*[voice.transcribe_voice(None, note, user_id=1) for _ in range(2)])
+            return first + [await voice.transcribe_voice(None, note, user_id=1)]
+        finally:
+            await voice.close_stt_pool()
+
+    assert asyncio.run(_run()) == ["text"] * 3
+    assert calls == ["same-note"]
@@ -0,0 +1,46 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.main import _DrainingRequestHandler
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "x"},
+        "text": "hi",
+    },
+}
+
+
+def test_acknowledges_at_once_and_drains_on_close():
+    async def _run():
+        seen = []
+        release = asyncio.Event()
+        dp = Dispatcher()
+
+        @dp.message()
+        async def _echo(message: Message):
+            await release.wait()
+            seen.append(message.text)
+
+        bot = Bot("123456:TEST")
+        handler = _DrainingRequestHandler(dispatcher=dp, bot=bot, secret_token="s3cret", drain_timeout=5.0)
+        app = web.Application()
+        handler.register(app, path="/webhook")
+        async with TestClient(TestServer(app)) as client:
+            assert (await client.post("/webhook", json=UPDATE)).status == 401
+            resp = await client.post("/webhook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+            assert resp.status == 200
+            assert seen == [] and len(handler._tasks) == 1
+            asyncio.get_running_loop().call_later(0.05, release.set)
+            await handler.close()
+        assert seen == ["hi"] and not handler._tasks
+
+    asyncio.run(_run())